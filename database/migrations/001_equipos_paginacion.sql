@@ -0,0 +1,13 @@
+-- ============================================================
+-- 001: paginación por cursor de GET /equipos
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/001_equipos_paginacion.sql
+-- ============================================================
+BEGIN;
+
+UPDATE equipos SET fecha_registro = NOW() WHERE fecha_registro IS NULL;
+ALTER TABLE equipos ALTER COLUMN fecha_registro SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_equipos_fecha_registro_id ON equipos (fecha_registro, id);
+
+COMMIT;
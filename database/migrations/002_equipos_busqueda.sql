@@ -0,0 +1,71 @@
+-- ============================================================
+-- 002: búsqueda de equipos (texto completo + trigramas)
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/002_equipos_busqueda.sql
+-- ============================================================
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- El servicio ya leía y escribía equipos.nombre, pero la columna faltaba en el schema
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS nombre VARCHAR(200);
+
+CREATE TABLE IF NOT EXISTS equipos_busqueda (
+    equipo_id INT PRIMARY KEY REFERENCES equipos(id) ON DELETE CASCADE,
+    texto TEXT NOT NULL,
+    documento TSVECTOR NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS equipos_terminos (
+    termino TEXT PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION equipos_busqueda_actualizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    texto TEXT := lower(concat_ws(' ', NEW.codigo_inventario, NEW.numero_serie, NEW.nombre, NEW.marca, NEW.modelo));
+BEGIN
+    INSERT INTO equipos_busqueda (equipo_id, texto, documento)
+    VALUES (NEW.id, texto, to_tsvector('simple', texto))
+    ON CONFLICT (equipo_id) DO UPDATE
+    SET texto = EXCLUDED.texto, documento = EXCLUDED.documento;
+
+    -- Solo palabras sin dígitos: códigos y series se buscan por prefijo o subcadena
+    INSERT INTO equipos_terminos (termino)
+    SELECT lexema FROM unnest(tsvector_to_array(to_tsvector('simple', texto))) AS lexema
+    WHERE lexema !~ '[0-9]'
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_equipos_busqueda ON equipos;
+CREATE TRIGGER trg_equipos_busqueda
+AFTER INSERT OR UPDATE OF codigo_inventario, numero_serie, nombre, marca, modelo ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_busqueda_actualizar();
+
+-- Carga inicial con los equipos existentes (antes de crear los índices)
+INSERT INTO equipos_busqueda (equipo_id, texto, documento)
+SELECT id, texto, to_tsvector('simple', texto)
+FROM (
+    SELECT id, lower(concat_ws(' ', codigo_inventario, numero_serie, nombre, marca, modelo)) AS texto
+    FROM equipos
+) t
+ON CONFLICT (equipo_id) DO UPDATE
+SET texto = EXCLUDED.texto, documento = EXCLUDED.documento;
+
+INSERT INTO equipos_terminos (termino)
+SELECT DISTINCT lexema
+FROM equipos_busqueda, unnest(tsvector_to_array(documento)) AS lexema
+WHERE lexema !~ '[0-9]'
+ON CONFLICT DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_equipos_busqueda_documento ON equipos_busqueda USING gin (documento);
+CREATE INDEX IF NOT EXISTS idx_equipos_busqueda_texto ON equipos_busqueda USING gin (texto gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_equipos_terminos_trgm ON equipos_terminos USING gin (termino gin_trgm_ops);
+
+COMMIT;
+
+ANALYZE equipos_busqueda;
+ANALYZE equipos_terminos;
@@ -0,0 +1,59 @@
+-- ============================================================
+-- 003: equipos.especificaciones de TEXT a JSONB
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/003_especificaciones_jsonb.sql
+-- ============================================================
+BEGIN;
+
+-- Convierte especificaciones heredadas en texto libre a JSONB.
+-- Un objeto JSON válido se usa tal cual; otro texto se guarda en "descripcion"
+-- y se extraen los atributos reconocibles (cpu, ram_gb, almacenamiento_*).
+CREATE OR REPLACE FUNCTION especificaciones_a_jsonb(texto TEXT) RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    resultado JSONB;
+    m TEXT[];
+BEGIN
+    IF texto IS NULL OR btrim(texto) = '' THEN
+        RETURN NULL;
+    END IF;
+
+    BEGIN
+        resultado := texto::jsonb;
+        IF jsonb_typeof(resultado) = 'object' THEN
+            RETURN resultado;
+        END IF;
+    EXCEPTION WHEN invalid_text_representation THEN
+        NULL;
+    END;
+
+    resultado := jsonb_build_object('descripcion', texto);
+
+    m := regexp_match(texto, '(\d+)\s*GB\s*RAM', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object('ram_gb', m[1]::int);
+    END IF;
+
+    m := regexp_match(texto, '(\d+)\s*(GB|TB)\s*(SSD|HDD)', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object(
+            'almacenamiento_gb', m[1]::int * CASE WHEN upper(m[2]) = 'TB' THEN 1024 ELSE 1 END,
+            'almacenamiento_tipo', upper(m[3])
+        );
+    END IF;
+
+    m := regexp_match(texto, '\m(i[3579]|ryzen\s*[3579])\M', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object('cpu', lower(m[1]));
+    END IF;
+
+    RETURN resultado;
+END;
+$$;
+
+ALTER TABLE equipos
+    ALTER COLUMN especificaciones TYPE JSONB USING especificaciones_a_jsonb(especificaciones);
+
+CREATE INDEX IF NOT EXISTS idx_equipos_especificaciones ON equipos USING gin (especificaciones);
+
+COMMIT;
@@ -0,0 +1,21 @@
+-- ============================================================
+-- 004: tabla movimientos_equipos (usada por /movimientos) e índice por ubicación
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/004_movimientos_equipos.sql
+-- ============================================================
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS movimientos_equipos (
+    id SERIAL PRIMARY KEY,
+    equipo_id INT NOT NULL REFERENCES equipos(id) ON DELETE CASCADE,
+    ubicacion_origen_id INT REFERENCES ubicaciones(id),
+    ubicacion_destino_id INT NOT NULL REFERENCES ubicaciones(id),
+    usuario_responsable_id INT REFERENCES usuarios(id),
+    motivo TEXT,
+    observaciones TEXT,
+    fecha_movimiento TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_equipos_ubicacion ON equipos (ubicacion_actual_id);
+
+COMMIT;
@@ -0,0 +1,69 @@
+-- ============================================================
+-- 005: historial paginado y ubicación de los equipos en una fecha
+-- Cada movimiento guarda hasta cuándo estuvo el equipo en el destino
+-- (fecha_hasta) y si es su primer movimiento; el trigger los mantiene.
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/005_movimientos_historial.sql
+-- ============================================================
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE movimientos_equipos ADD COLUMN IF NOT EXISTS fecha_hasta TIMESTAMP;
+ALTER TABLE movimientos_equipos ADD COLUMN IF NOT EXISTS primero BOOLEAN NOT NULL DEFAULT TRUE;
+
+UPDATE movimientos_equipos m
+SET fecha_hasta = x.fecha_hasta, primero = x.primero
+FROM (
+    SELECT id,
+           lead(fecha_movimiento) OVER w AS fecha_hasta,
+           row_number() OVER w = 1 AS primero
+    FROM movimientos_equipos
+    WINDOW w AS (PARTITION BY equipo_id ORDER BY fecha_movimiento, id)
+) x
+WHERE m.id = x.id;
+
+CREATE INDEX IF NOT EXISTS idx_movimientos_equipo_fecha
+    ON movimientos_equipos (equipo_id, fecha_movimiento, id);
+CREATE INDEX IF NOT EXISTS idx_movimientos_destino_periodo ON movimientos_equipos
+    USING gist (ubicacion_destino_id, tsrange(fecha_movimiento, fecha_hasta));
+CREATE INDEX IF NOT EXISTS idx_movimientos_origen_primero
+    ON movimientos_equipos (ubicacion_origen_id, fecha_movimiento) WHERE primero;
+
+CREATE OR REPLACE FUNCTION movimientos_equipos_encadenar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    anterior_id INT;
+    siguiente RECORD;
+BEGIN
+    SELECT id INTO anterior_id
+    FROM movimientos_equipos
+    WHERE equipo_id = NEW.equipo_id AND (fecha_movimiento, id) < (NEW.fecha_movimiento, NEW.id)
+    ORDER BY fecha_movimiento DESC, id DESC
+    LIMIT 1;
+
+    SELECT id, fecha_movimiento INTO siguiente
+    FROM movimientos_equipos
+    WHERE equipo_id = NEW.equipo_id AND (fecha_movimiento, id) > (NEW.fecha_movimiento, NEW.id)
+    ORDER BY fecha_movimiento, id
+    LIMIT 1;
+
+    NEW.fecha_hasta := siguiente.fecha_movimiento;
+    NEW.primero := anterior_id IS NULL;
+
+    IF anterior_id IS NOT NULL THEN
+        UPDATE movimientos_equipos SET fecha_hasta = NEW.fecha_movimiento WHERE id = anterior_id;
+    ELSIF siguiente.id IS NOT NULL THEN
+        UPDATE movimientos_equipos SET primero = FALSE WHERE id = siguiente.id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_movimientos_equipos_encadenar ON movimientos_equipos;
+CREATE TRIGGER trg_movimientos_equipos_encadenar
+BEFORE INSERT ON movimientos_equipos
+FOR EACH ROW EXECUTE FUNCTION movimientos_equipos_encadenar();
+
+COMMIT;
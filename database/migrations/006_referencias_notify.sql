@@ -0,0 +1,34 @@
+-- ============================================================
+-- 006: NOTIFY referencias al modificar ubicaciones, categorias_equipos o
+-- proveedores (cache en memoria de los servicios) y columna proveedores.activo
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/006_referencias_notify.sql
+-- ============================================================
+BEGIN;
+
+ALTER TABLE proveedores ADD COLUMN IF NOT EXISTS activo BOOLEAN DEFAULT TRUE;
+
+CREATE OR REPLACE FUNCTION referencias_notificar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('referencias', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_ubicaciones_notificar ON ubicaciones;
+CREATE TRIGGER trg_ubicaciones_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON ubicaciones
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+DROP TRIGGER IF EXISTS trg_categorias_equipos_notificar ON categorias_equipos;
+CREATE TRIGGER trg_categorias_equipos_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categorias_equipos
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+DROP TRIGGER IF EXISTS trg_proveedores_notificar ON proveedores;
+CREATE TRIGGER trg_proveedores_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON proveedores
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+COMMIT;
@@ -0,0 +1,58 @@
+-- ============================================================
+-- 007: feed de cambios de equipos (GET /equipos/changes)
+-- equipos.version (transacción de la última modificación), trigger que la
+-- mantiene junto con fecha_ultima_actualizacion, y tabla equipos_eliminados
+-- con los borrados.
+-- Aplicar sobre bases existentes:
+--   psql "$DATABASE_URL" -f database/migrations/007_equipos_cambios.sql
+-- ============================================================
+BEGIN;
+
+-- Los equipos existentes quedan con version 0: entran en la primera sincronización
+ALTER TABLE equipos ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS equipos_eliminados (
+    equipo_id INT PRIMARY KEY,
+    codigo_inventario VARCHAR(100),
+    version BIGINT NOT NULL,
+    fecha_eliminacion TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_equipos_version ON equipos (version, id);
+CREATE INDEX IF NOT EXISTS idx_equipos_eliminados_version ON equipos_eliminados (version, equipo_id);
+
+CREATE OR REPLACE FUNCTION equipos_registrar_cambio() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Un UPDATE que no cambia nada no genera cambio
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    END IF;
+    NEW.version := pg_current_xact_id()::text::bigint;
+    NEW.fecha_ultima_actualizacion := NOW();
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION equipos_registrar_eliminado() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO equipos_eliminados (equipo_id, codigo_inventario, version)
+    VALUES (OLD.id, OLD.codigo_inventario, pg_current_xact_id()::text::bigint)
+    ON CONFLICT (equipo_id) DO UPDATE
+    SET version = EXCLUDED.version, fecha_eliminacion = NOW();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_equipos_version ON equipos;
+CREATE TRIGGER trg_equipos_version
+BEFORE INSERT OR UPDATE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_registrar_cambio();
+
+DROP TRIGGER IF EXISTS trg_equipos_eliminado ON equipos;
+CREATE TRIGGER trg_equipos_eliminado
+AFTER DELETE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_registrar_eliminado();
+
+COMMIT;
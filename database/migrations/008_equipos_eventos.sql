@@ -0,0 +1,49 @@
+-- ============================================================
+-- 008: NOTIFY equipos_eventos al crear, modificar o eliminar equipos y al
+-- registrar movimientos (GET /equipos/eventos, Server-Sent Events)
+-- Aplicar sobre bases existentes (después de 007):
+--   psql "$DATABASE_URL" -f database/migrations/008_equipos_eventos.sql
+-- ============================================================
+BEGIN;
+
+CREATE OR REPLACE FUNCTION equipos_eventos_notificar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'movimientos_equipos' THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', 'movimiento',
+            'movimiento_id', NEW.id,
+            'equipo_id', NEW.equipo_id,
+            'ubicacion_origen_id', NEW.ubicacion_origen_id,
+            'ubicacion_destino_id', NEW.ubicacion_destino_id,
+            'fecha_movimiento', NEW.fecha_movimiento
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', 'equipo_eliminado',
+            'equipo_id', OLD.id,
+            'codigo_inventario', OLD.codigo_inventario
+        )::text);
+    ELSIF TG_OP = 'INSERT' OR NEW IS DISTINCT FROM OLD THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', CASE TG_OP WHEN 'INSERT' THEN 'equipo_creado' ELSE 'equipo_actualizado' END,
+            'equipo_id', NEW.id,
+            'codigo_inventario', NEW.codigo_inventario,
+            'version', NEW.version
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_equipos_eventos ON equipos;
+CREATE TRIGGER trg_equipos_eventos
+AFTER INSERT OR UPDATE OR DELETE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_eventos_notificar();
+
+DROP TRIGGER IF EXISTS trg_movimientos_equipos_eventos ON movimientos_equipos;
+CREATE TRIGGER trg_movimientos_equipos_eventos
+AFTER INSERT ON movimientos_equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_eventos_notificar();
+
+COMMIT;
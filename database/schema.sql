@@ -3,6 +3,9 @@
 -- ============================================================
 
 DROP TABLE IF EXISTS notificaciones CASCADE;
+DROP TABLE IF EXISTS equipos_terminos CASCADE;
+DROP TABLE IF EXISTS equipos_busqueda CASCADE;
+DROP TABLE IF EXISTS equipos_eliminados CASCADE;
 DROP TABLE IF EXISTS mantenimientos CASCADE;
 DROP TABLE IF EXISTS movimientos_equipos CASCADE;
 DROP TABLE IF EXISTS equipos CASCADE;
@@ -12,6 +15,11 @@ DROP TABLE IF EXISTS categorias_equipos CASCADE;
 DROP TABLE IF EXISTS ubicaciones CASCADE;
 DROP TABLE IF EXISTS usuarios CASCADE;
 
+-- Búsqueda aproximada (trigramas) en equipos
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Índice GiST (ubicación, periodo) de movimientos_equipos
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- ============================================================
 -- TABLA USUARIOS
 -- ============================================================
@@ -85,6 +93,7 @@ CREATE TABLE proveedores (
     contacto_telefono VARCHAR(50),
     sitio_web VARCHAR(200),
     calificacion DECIMAL(3,2),
+    activo BOOLEAN DEFAULT TRUE,
     fecha_registro TIMESTAMP DEFAULT NOW(),
     notas TEXT
 );
@@ -94,6 +103,77 @@ VALUES
 ('TechSupply SAC', '20123456789', '987654321', 'ventas@techsupply.com', 'Carlos Ruiz', '955123456', 4.5),
 ('Proveedores UNI SRL', '20654321987', '912345678', 'contacto@uni-proveedores.com', 'María Lopez', '944998877', 4.0);
 
+-- ============================================================
+-- AVISOS DE CAMBIO EN DATOS DE REFERENCIA
+-- ============================================================
+-- Los servicios guardan estas tablas en memoria y las recargan al recibir
+-- NOTIFY referencias con el nombre de la tabla modificada.
+CREATE OR REPLACE FUNCTION referencias_notificar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('referencias', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_ubicaciones_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON ubicaciones
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+CREATE TRIGGER trg_categorias_equipos_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categorias_equipos
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+CREATE TRIGGER trg_proveedores_notificar
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON proveedores
+FOR EACH STATEMENT EXECUTE FUNCTION referencias_notificar();
+
+-- Convierte especificaciones heredadas en texto libre a JSONB.
+-- Un objeto JSON válido se usa tal cual; otro texto se guarda en "descripcion"
+-- y se extraen los atributos reconocibles (cpu, ram_gb, almacenamiento_*).
+CREATE OR REPLACE FUNCTION especificaciones_a_jsonb(texto TEXT) RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    resultado JSONB;
+    m TEXT[];
+BEGIN
+    IF texto IS NULL OR btrim(texto) = '' THEN
+        RETURN NULL;
+    END IF;
+
+    BEGIN
+        resultado := texto::jsonb;
+        IF jsonb_typeof(resultado) = 'object' THEN
+            RETURN resultado;
+        END IF;
+    EXCEPTION WHEN invalid_text_representation THEN
+        NULL;
+    END;
+
+    resultado := jsonb_build_object('descripcion', texto);
+
+    m := regexp_match(texto, '(\d+)\s*GB\s*RAM', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object('ram_gb', m[1]::int);
+    END IF;
+
+    m := regexp_match(texto, '(\d+)\s*(GB|TB)\s*(SSD|HDD)', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object(
+            'almacenamiento_gb', m[1]::int * CASE WHEN upper(m[2]) = 'TB' THEN 1024 ELSE 1 END,
+            'almacenamiento_tipo', upper(m[3])
+        );
+    END IF;
+
+    m := regexp_match(texto, '\m(i[3579]|ryzen\s*[3579])\M', 'i');
+    IF m IS NOT NULL THEN
+        resultado := resultado || jsonb_build_object('cpu', lower(m[1]));
+    END IF;
+
+    RETURN resultado;
+END;
+$$;
+
 -- ============================================================
 -- TABLA EQUIPOS
 -- ============================================================
@@ -101,10 +181,11 @@ CREATE TABLE equipos (
     id SERIAL PRIMARY KEY,
     ubicacion_actual_id INT REFERENCES ubicaciones(id),
     codigo_inventario VARCHAR(100) UNIQUE NOT NULL,
+    nombre VARCHAR(200),
     marca VARCHAR(100),
     modelo VARCHAR(150),
     numero_serie VARCHAR(150),
-    especificaciones TEXT,
+    especificaciones JSONB,
     fecha_compra DATE,
     costo_compra DECIMAL(12,2),
     categoria_id INT REFERENCES categorias_equipos(id),
@@ -113,21 +194,232 @@ CREATE TABLE equipos (
     estado_fisico VARCHAR(50),
     imagen_url TEXT,
     notas TEXT,
-    fecha_registro TIMESTAMP DEFAULT NOW(),
+    fecha_registro TIMESTAMP NOT NULL DEFAULT NOW(),
     asignado_a_id INT REFERENCES usuarios(id),
     fecha_ultima_actualizacion TIMESTAMP DEFAULT NOW(),
-    proveedor_id INT REFERENCES proveedores(id)
+    proveedor_id INT REFERENCES proveedores(id),
+    -- Transacción de la última modificación (feed GET /equipos/changes)
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- ------------------------------------------------------------
+-- Feed de cambios (GET /equipos/changes)
+-- Un trigger mantiene version y fecha_ultima_actualizacion en cada INSERT o
+-- UPDATE; los borrados quedan en equipos_eliminados con la misma version.
+-- ------------------------------------------------------------
+CREATE TABLE equipos_eliminados (
+    equipo_id INT PRIMARY KEY,
+    codigo_inventario VARCHAR(100),
+    version BIGINT NOT NULL,
+    fecha_eliminacion TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_equipos_version ON equipos (version, id);
+CREATE INDEX idx_equipos_eliminados_version ON equipos_eliminados (version, equipo_id);
+
+CREATE OR REPLACE FUNCTION equipos_registrar_cambio() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Un UPDATE que no cambia nada no genera cambio
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    END IF;
+    NEW.version := pg_current_xact_id()::text::bigint;
+    NEW.fecha_ultima_actualizacion := NOW();
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION equipos_registrar_eliminado() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO equipos_eliminados (equipo_id, codigo_inventario, version)
+    VALUES (OLD.id, OLD.codigo_inventario, pg_current_xact_id()::text::bigint)
+    ON CONFLICT (equipo_id) DO UPDATE
+    SET version = EXCLUDED.version, fecha_eliminacion = NOW();
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_equipos_version
+BEFORE INSERT OR UPDATE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_registrar_cambio();
+
+CREATE TRIGGER trg_equipos_eliminado
+AFTER DELETE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_registrar_eliminado();
+
+-- ------------------------------------------------------------
+-- Eventos en vivo (GET /equipos/eventos, Server-Sent Events)
+-- NOTIFY equipos_eventos '<json>' al crear, modificar o eliminar un equipo y
+-- al registrar un movimiento (trigger de movimientos_equipos más abajo).
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION equipos_eventos_notificar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'movimientos_equipos' THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', 'movimiento',
+            'movimiento_id', NEW.id,
+            'equipo_id', NEW.equipo_id,
+            'ubicacion_origen_id', NEW.ubicacion_origen_id,
+            'ubicacion_destino_id', NEW.ubicacion_destino_id,
+            'fecha_movimiento', NEW.fecha_movimiento
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', 'equipo_eliminado',
+            'equipo_id', OLD.id,
+            'codigo_inventario', OLD.codigo_inventario
+        )::text);
+    ELSIF TG_OP = 'INSERT' OR NEW IS DISTINCT FROM OLD THEN
+        PERFORM pg_notify('equipos_eventos', json_build_object(
+            'tipo', CASE TG_OP WHEN 'INSERT' THEN 'equipo_creado' ELSE 'equipo_actualizado' END,
+            'equipo_id', NEW.id,
+            'codigo_inventario', NEW.codigo_inventario,
+            'version', NEW.version
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_equipos_eventos
+AFTER INSERT OR UPDATE OR DELETE ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_eventos_notificar();
+
+-- ------------------------------------------------------------
+-- Búsqueda de equipos (GET /equipos/buscar)
+-- equipos_busqueda guarda el texto y el tsvector de cada equipo;
+-- equipos_terminos es el vocabulario usado para corregir errores de tipeo.
+-- Ambas se mantienen con un trigger sobre equipos.
+-- ------------------------------------------------------------
+CREATE TABLE equipos_busqueda (
+    equipo_id INT PRIMARY KEY REFERENCES equipos(id) ON DELETE CASCADE,
+    texto TEXT NOT NULL,
+    documento TSVECTOR NOT NULL
+);
+
+CREATE INDEX idx_equipos_busqueda_documento ON equipos_busqueda USING gin (documento);
+CREATE INDEX idx_equipos_busqueda_texto ON equipos_busqueda USING gin (texto gin_trgm_ops);
+
+CREATE TABLE equipos_terminos (
+    termino TEXT PRIMARY KEY
 );
 
+CREATE INDEX idx_equipos_terminos_trgm ON equipos_terminos USING gin (termino gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION equipos_busqueda_actualizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    texto TEXT := lower(concat_ws(' ', NEW.codigo_inventario, NEW.numero_serie, NEW.nombre, NEW.marca, NEW.modelo));
+BEGIN
+    INSERT INTO equipos_busqueda (equipo_id, texto, documento)
+    VALUES (NEW.id, texto, to_tsvector('simple', texto))
+    ON CONFLICT (equipo_id) DO UPDATE
+    SET texto = EXCLUDED.texto, documento = EXCLUDED.documento;
+
+    -- Solo palabras sin dígitos: códigos y series se buscan por prefijo o subcadena
+    INSERT INTO equipos_terminos (termino)
+    SELECT lexema FROM unnest(tsvector_to_array(to_tsvector('simple', texto))) AS lexema
+    WHERE lexema !~ '[0-9]'
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_equipos_busqueda
+AFTER INSERT OR UPDATE OF codigo_inventario, numero_serie, nombre, marca, modelo ON equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_busqueda_actualizar();
+
 INSERT INTO equipos (
-    ubicacion_actual_id, codigo_inventario, marca, modelo, numero_serie, 
+    ubicacion_actual_id, codigo_inventario, nombre, marca, modelo, numero_serie, 
     especificaciones, fecha_compra, costo_compra, categoria_id,
     fecha_garantia_fin, estado_operativo, estado_fisico, proveedor_id
 ) VALUES
-(1, 'EQ-2024-001', 'Dell', 'Inspiron 15', 'SN123', 'i5, 8GB RAM, 256GB SSD', '2023-01-10', 2500.00, 1, '2025-01-10', 'operativo', 'bueno', 1),
-(1, 'EQ-2024-002', 'HP', 'ProDesk 400', 'SN456', 'i7, 16GB RAM, 512GB SSD', '2022-05-18', 3200.00, 2, '2024-05-18', 'en_reparacion', 'regular', 2),
-(2, 'EQ-2024-003', 'Epson', 'X450', 'SN789', 'Proyector HD', '2021-03-08', 1800.00, 3, '2023-03-08', 'operativo', 'bueno', 1),
-(3, 'EQ-2024-004', 'Canon', 'LBP6030', 'SN159', 'Impresora Láser', '2020-10-21', 900.00, 4, '2022-10-21', 'obsoleto', 'regular', 2);
+(1, 'EQ-2024-001', 'Laptop Dell Inspiron', 'Dell', 'Inspiron 15', 'SN123', especificaciones_a_jsonb('i5, 8GB RAM, 256GB SSD'), '2023-01-10', 2500.00, 1, '2025-01-10', 'operativo', 'bueno', 1),
+(1, 'EQ-2024-002', 'PC de escritorio HP', 'HP', 'ProDesk 400', 'SN456', especificaciones_a_jsonb('i7, 16GB RAM, 512GB SSD'), '2022-05-18', 3200.00, 2, '2024-05-18', 'en_reparacion', 'regular', 2),
+(2, 'EQ-2024-003', 'Proyector Epson', 'Epson', 'X450', 'SN789', especificaciones_a_jsonb('Proyector HD'), '2021-03-08', 1800.00, 3, '2023-03-08', 'operativo', 'bueno', 1),
+(3, 'EQ-2024-004', 'Impresora Canon', 'Canon', 'LBP6030', 'SN159', especificaciones_a_jsonb('Impresora Láser'), '2020-10-21', 900.00, 4, '2022-10-21', 'obsoleto', 'regular', 2);
+
+-- Paginación por cursor de GET /equipos (ORDER BY fecha_registro DESC, id DESC)
+CREATE INDEX idx_equipos_fecha_registro_id ON equipos (fecha_registro, id);
+
+-- Filtro por ubicación y traslados masivos desde una ubicación
+CREATE INDEX idx_equipos_ubicacion ON equipos (ubicacion_actual_id);
+
+-- Filtros por especificaciones (@> y ?) de GET /equipos?spec=
+CREATE INDEX idx_equipos_especificaciones ON equipos USING gin (especificaciones);
+
+-- ============================================================
+-- TABLA MOVIMIENTOS DE EQUIPOS
+-- ============================================================
+CREATE TABLE movimientos_equipos (
+    id SERIAL PRIMARY KEY,
+    equipo_id INT NOT NULL REFERENCES equipos(id) ON DELETE CASCADE,
+    ubicacion_origen_id INT REFERENCES ubicaciones(id),
+    ubicacion_destino_id INT NOT NULL REFERENCES ubicaciones(id),
+    usuario_responsable_id INT REFERENCES usuarios(id),
+    motivo TEXT,
+    observaciones TEXT,
+    fecha_movimiento TIMESTAMP NOT NULL DEFAULT NOW(),
+    -- Fecha del siguiente movimiento del equipo (NULL: sigue en el destino)
+    fecha_hasta TIMESTAMP,
+    -- Primer movimiento del equipo: antes estaba en ubicacion_origen_id
+    primero BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+-- Historial por equipo y ubicación de un equipo en una fecha (GET /equipos/{id}/movimientos, /ubicacion)
+CREATE INDEX idx_movimientos_equipo_fecha ON movimientos_equipos (equipo_id, fecha_movimiento, id);
+
+-- Inventario de una ubicación en una fecha (GET /ubicaciones/{id}/equipos?fecha=)
+CREATE INDEX idx_movimientos_destino_periodo ON movimientos_equipos
+    USING gist (ubicacion_destino_id, tsrange(fecha_movimiento, fecha_hasta));
+CREATE INDEX idx_movimientos_origen_primero ON movimientos_equipos (ubicacion_origen_id, fecha_movimiento)
+    WHERE primero;
+
+-- Mantiene fecha_hasta y primero al registrar un movimiento, también si llega con
+-- fecha anterior a otros. Los endpoints bloquean el equipo antes de insertar.
+CREATE OR REPLACE FUNCTION movimientos_equipos_encadenar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    anterior_id INT;
+    siguiente RECORD;
+BEGIN
+    SELECT id INTO anterior_id
+    FROM movimientos_equipos
+    WHERE equipo_id = NEW.equipo_id AND (fecha_movimiento, id) < (NEW.fecha_movimiento, NEW.id)
+    ORDER BY fecha_movimiento DESC, id DESC
+    LIMIT 1;
+
+    SELECT id, fecha_movimiento INTO siguiente
+    FROM movimientos_equipos
+    WHERE equipo_id = NEW.equipo_id AND (fecha_movimiento, id) > (NEW.fecha_movimiento, NEW.id)
+    ORDER BY fecha_movimiento, id
+    LIMIT 1;
+
+    NEW.fecha_hasta := siguiente.fecha_movimiento;
+    NEW.primero := anterior_id IS NULL;
+
+    IF anterior_id IS NOT NULL THEN
+        UPDATE movimientos_equipos SET fecha_hasta = NEW.fecha_movimiento WHERE id = anterior_id;
+    ELSIF siguiente.id IS NOT NULL THEN
+        UPDATE movimientos_equipos SET primero = FALSE WHERE id = siguiente.id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_movimientos_equipos_encadenar
+BEFORE INSERT ON movimientos_equipos
+FOR EACH ROW EXECUTE FUNCTION movimientos_equipos_encadenar();
+
+-- Evento "movimiento" de GET /equipos/eventos
+CREATE TRIGGER trg_movimientos_equipos_eventos
+AFTER INSERT ON movimientos_equipos
+FOR EACH ROW EXECUTE FUNCTION equipos_eventos_notificar();
 
 -- ============================================================
 -- TABLA MANTENIMIENTOS
@@ -0,0 +1,53 @@
+"""
+Peticiones GET condicionales hacia el API Gateway.
+
+Guarda la última respuesta con ETag de cada URL y la reenvía con
+If-None-Match; si el servidor responde 304 se reutiliza el cuerpo guardado.
+
+Los servicios emiten ETags débiles: un hash del cuerpo calculado después de
+ejecutar la consulta. Un 304 ahorra la transferencia y el re-render, no el
+trabajo de la base de datos.
+"""
+import threading
+
+import requests
+
+# Streamlit atiende cada sesión en su propio hilo y requests.Session no es
+# thread-safe: una sesión por hilo (mantiene la conexión abierta entre reruns)
+_local = threading.local()
+
+# (url, params) -> respuesta 200 con ETag; compartido entre hilos, protegido por _lock
+_responses = {}
+_lock = threading.Lock()
+MAX_ENTRIES = 200
+
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def conditional_get(url, params=None, timeout=10):
+    """GET que devuelve la respuesta guardada cuando el servidor contesta 304."""
+    key = (url, tuple(sorted((params or {}).items())))
+    with _lock:
+        cached = _responses.get(key)
+
+    headers = {}
+    if cached is not None:
+        headers["If-None-Match"] = cached.headers["ETag"]
+
+    response = _session().get(url, params=params, headers=headers, timeout=timeout)
+
+    if response.status_code == 304 and cached is not None:
+        return cached
+
+    if response.status_code == 200 and "ETag" in response.headers:
+        with _lock:
+            if len(_responses) >= MAX_ENTRIES and key not in _responses:
+                _responses.pop(next(iter(_responses)))
+            _responses[key] = response
+
+    return response
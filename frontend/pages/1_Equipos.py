@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from api_cache import conditional_get
 import pandas as pd
 import os
 from datetime import datetime, date
@@ -76,8 +77,19 @@ def normalize_list(response, key_name):
     return []
 
 
-def get_equipos(categoria=None, estado=None):
+# Campos que usa cada vista; el servicio solo lee y une lo que se pide
+EQUIPOS_LIST_FIELDS = "id,codigo_inventario,nombre,marca,modelo,categoria_nombre,estado_operativo,ubicacion_nombre"
+EQUIPO_DETAIL_FIELDS = (
+    "codigo_inventario,nombre,marca,modelo,numero_serie,estado_operativo,categoria_nombre,"
+    "ubicacion_nombre,proveedor_nombre,fecha_compra,costo_compra,fecha_garantia_fin"
+)
+EQUIPOS_STATS_FIELDS = "estado_operativo,categoria_nombre,costo_compra,ubicacion_nombre"
+
+
+def get_equipos(categoria=None, estado=None, fields=None):
     params = {}
+    if fields:
+        params['fields'] = fields
     if categoria:
         params['categoria'] = categoria
     if estado:
@@ -93,9 +105,69 @@ def get_equipos(categoria=None, estado=None):
     return []
 
 
+EQUIPOS_PAGE_SIZE = 100
+
+
+def get_equipos_page(categoria=None, estado=None, cursor=None, include_total=False):
+    """Una página del listado; la siguiente se pide con el next_cursor devuelto."""
+    params = {"limit": EQUIPOS_PAGE_SIZE, "fields": EQUIPOS_LIST_FIELDS}
+    if categoria:
+        params['categoria'] = categoria
+    if estado:
+        params['estado'] = estado
+    if cursor:
+        params['cursor'] = cursor
+    if include_total:
+        params['include_total'] = "true"
+
+    try:
+        r = requests.get(f"{API_URL}/api/equipos/equipos", params=params, timeout=10)
+        if r.status_code == 200:
+            data = r.json()
+            if isinstance(data, dict) and "items" in data:
+                return data
+            return {"items": normalize_list(data, "equipos"), "next_cursor": None}
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+    return {"items": [], "next_cursor": None}
+
+
+def buscar_equipos(texto):
+    """Búsqueda por nombre, marca, modelo, serie o código, ordenada por relevancia."""
+    try:
+        r = requests.get(
+            f"{API_URL}/api/equipos/equipos/buscar",
+            params={"q": texto, "limit": EQUIPOS_PAGE_SIZE},
+            timeout=10
+        )
+        if r.status_code == 200:
+            return r.json().get("items", [])
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+    return []
+
+
+def get_equipo_detalle(equipo_id):
+    """Detalle de un equipo con solo los campos que muestra el panel."""
+    try:
+        r = requests.get(
+            f"{API_URL}/api/equipos/equipos/{equipo_id}",
+            params={"fields": EQUIPO_DETAIL_FIELDS},
+            timeout=10
+        )
+        if r.status_code == 200:
+            return r.json()
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+    return None
+
+
 def get_categorias():
     try:
-        r = requests.get(f"{API_URL}/api/categorias", timeout=10)
+        r = conditional_get(f"{API_URL}/api/equipos/categorias", timeout=10)
         if r.status_code == 200:
             return normalize_list(r.json(), "categorias")
     except:
@@ -105,7 +177,7 @@ def get_categorias():
 
 def get_ubicaciones():
     try:
-        r = requests.get(f"{API_URL}/api/ubicaciones", timeout=10)
+        r = conditional_get(f"{API_URL}/api/equipos/ubicaciones", timeout=10)
         if r.status_code == 200:
             return normalize_list(r.json(), "ubicaciones")
     except:
@@ -115,7 +187,7 @@ def get_ubicaciones():
 
 def get_proveedores():
     try:
-        r = requests.get(f"{API_URL}/api/proveedores", timeout=10)
+        r = conditional_get(f"{API_URL}/api/proveedores/proveedores", timeout=10)
         if r.status_code == 200:
             return normalize_list(r.json(), "proveedores")
     except:
@@ -238,6 +310,11 @@ with tab1:
                 key="filtro_ub"
             )
         
+        busqueda = st.text_input(
+            "Buscar por nombre, marca, modelo, número de serie o código",
+            key="busqueda_equipos"
+        ).strip()
+
         # Botón de búsqueda
         col1, col2, col3 = st.columns([1, 1, 4])
         with col1:
@@ -257,11 +334,33 @@ with tab1:
     estado_filtro = filtro_estado if filtro_estado != "Todos" else None
     ubicacion_filtro = filtro_ubicacion if filtro_ubicacion != "Todas" else None
 
-    equipos = get_equipos(categoria=categoria_filtro, estado=estado_filtro)
+    # Pila de cursores: el último es el de la página actual; se reinicia al cambiar filtros
+    filtros = (categoria_filtro, estado_filtro)
+    if st.session_state.get("equipos_filtros") != filtros:
+        st.session_state["equipos_filtros"] = filtros
+        st.session_state["equipos_cursores"] = [None]
+    cursores = st.session_state["equipos_cursores"]
+
+    if len(busqueda) >= 2:
+        # La búsqueda devuelve los resultados más relevantes en una sola página
+        resultados = buscar_equipos(busqueda)
+        pagina = {"items": resultados, "next_cursor": None, "total": len(resultados)}
+        cursores = st.session_state["equipos_cursores"] = [None]
+    else:
+        pagina = get_equipos_page(
+            categoria=categoria_filtro,
+            estado=estado_filtro,
+            cursor=cursores[-1],
+            include_total=len(cursores) == 1,
+        )
+    if "total" in pagina:
+        st.session_state["equipos_total"] = pagina["total"]
+    equipos = pagina["items"]
 
     # -------- Mostrar tabla --------
     if equipos:
-        st.success(f"Se encontraron {len(equipos)} equipos")
+        total = st.session_state.get("equipos_total", len(equipos))
+        st.success(f"Se encontraron {total} equipos (página {len(cursores)})")
 
         # Convertir a DataFrame seguro
         df = pd.DataFrame(equipos)
@@ -286,6 +385,16 @@ with tab1:
 
         st.dataframe(df_view, use_container_width=True, height=400)
 
+        col_prev, _, col_next = st.columns([1, 4, 1])
+        with col_prev:
+            if st.button("⬅️ Anterior", use_container_width=True, disabled=len(cursores) == 1):
+                cursores.pop()
+                st.experimental_rerun()
+        with col_next:
+            if st.button("Siguiente ➡️", use_container_width=True, disabled=not pagina.get("next_cursor")):
+                cursores.append(pagina["next_cursor"])
+                st.experimental_rerun()
+
         # ----------------- DETALLE -----------------
         st.markdown("---")
         st.subheader("Detalle de Equipo")
@@ -320,6 +429,9 @@ with tab1:
         )
 
         # -------- Mostrar detalle --------
+        if equipo and equipo.get("id") is not None:
+            equipo = get_equipo_detalle(equipo["id"]) or equipo
+
         if equipo:
             col1, col2, col3 = st.columns(3)
 
@@ -461,13 +573,42 @@ with tab2:
                 except Exception as e:
                     st.error(f"❌ Error de conexión: {e}")
 
+    # -------- Importación masiva --------
+    with st.expander("📥 Importación masiva (CSV / XLSX)"):
+        st.caption(
+            "Columnas: codigo_inventario, nombre, marca, modelo, numero_serie, especificaciones, "
+            "categoria (o categoria_id), ubicacion (o ubicacion_actual_id), proveedor (o proveedor_id), "
+            "fecha_compra, costo_compra, fecha_garantia_fin, estado_operativo, estado_fisico, notas"
+        )
+        archivo = st.file_uploader("Archivo", type=["csv", "xlsx"], key="import_equipos")
+        parcial = st.checkbox("Importar las filas válidas aunque haya errores", key="import_parcial")
+
+        if archivo is not None and st.button("Importar", type="primary"):
+            try:
+                r = requests.post(
+                    f"{API_URL}/api/equipos/equipos/importar",
+                    params={"parcial": str(parcial).lower()},
+                    files={"archivo": (archivo.name, archivo.getvalue())},
+                    timeout=120
+                )
+                if r.status_code == 200:
+                    resultado = r.json()
+                    st.success(f"✅ {resultado['insertados']} de {resultado['filas']} filas importadas")
+                    if resultado["errores"]:
+                        st.warning(f"{len(resultado['errores'])} filas con errores")
+                        st.dataframe(pd.DataFrame(resultado["errores"]), use_container_width=True)
+                else:
+                    st.error(f"❌ Error: {r.text}")
+            except Exception as e:
+                st.error(f"❌ Error de conexión: {e}")
+
 # ======================================================================
 # TAB 3: ESTADÍSTICAS
 # ======================================================================
 with tab3:
     st.subheader("Estadísticas de Equipos")
 
-    equipos = get_equipos()
+    equipos = get_equipos(fields=EQUIPOS_STATS_FIELDS)
     if equipos:
         df = pd.DataFrame(equipos)
 
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from api_cache import conditional_get
 import pandas as pd
 import os
 
@@ -111,7 +112,7 @@ st.markdown("""
 # ================================
 def load_proveedores():
     try:
-        resp = requests.get(f"{API_URL}/api/proveedores", timeout=10)
+        resp = conditional_get(f"{API_URL}/api/proveedores/proveedores", timeout=10)
 
         if resp.status_code != 200:
             return []
@@ -138,7 +138,11 @@ st.markdown("""
 # =====================================================
 def load_equipos():
     try:
-        response = requests.get(f"{API_URL}/api/equipos", timeout=10)
+        response = requests.get(
+            f"{API_URL}/api/equipos/equipos",
+            # Sin proyección: la tabla "Equipos Registrados" muestra el registro completo
+            timeout=10
+        )
         if response.status_code != 200:
             return []
 
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from api_cache import conditional_get
 import json
 import pandas as pd
 import plotly.express as px
@@ -159,9 +160,42 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Funciones auxiliares
+BATCH_YEAR_DEFAULT = 2024
+
+@st.cache_data(ttl=60)  # Cachear por 1 minuto: evita repetir el lote en cada rerun
+def load_reportes_batch(year=None):
+    """Obtiene todos los datos de la página en una sola petición al gateway.
+
+    Lanza excepción si el lote falla, para que st.cache_data no guarde el fallo.
+    """
+    sub_requests = [
+        {"id": "dashboard", "service": "reportes", "path": "dashboard"},
+        {"id": "por_ubicacion", "service": "reportes", "path": "equipos-por-ubicacion"},
+        {"id": "por_estado", "service": "reportes", "path": "equipos-por-estado"},
+        {"id": "por_categoria", "service": "reportes", "path": "equipos-por-categoria"},
+        {"id": "costos", "service": "reportes", "path": "costos-mantenimiento", "params": {"year": year}},
+        {"id": "antiguedad", "service": "reportes", "path": "equipos-antiguedad"},
+    ]
+    response = requests.post(f"{API_URL}/api/batch", json={"requests": sub_requests}, timeout=15)
+    response.raise_for_status()
+    return {
+        r["id"]: r["body"]
+        for r in response.json().get("responses", [])
+        if r.get("status") == 200
+    }
+
+batch_year = st.session_state.get("year_costos", BATCH_YEAR_DEFAULT)
+try:
+    batch_data = load_reportes_batch(batch_year)
+except:
+    # Si el lote falla, cada función consulta su endpoint por separado
+    batch_data = {}
+
 def get_dashboard_data():
+    if "dashboard" in batch_data:
+        return batch_data["dashboard"]
     try:
-        response = requests.get(f"{API_URL}/api/reportes/dashboard", timeout=10)
+        response = conditional_get(f"{API_URL}/api/reportes/dashboard", timeout=10)
         if response.status_code == 200:
             return response.json()
         return None
@@ -169,8 +203,10 @@ def get_dashboard_data():
         return None
 
 def get_equipos_por_ubicacion():
+    if "por_ubicacion" in batch_data:
+        return batch_data["por_ubicacion"]
     try:
-        response = requests.get(f"{API_URL}/api/reportes/equipos-por-ubicacion", timeout=10)
+        response = conditional_get(f"{API_URL}/api/reportes/equipos-por-ubicacion", timeout=10)
         if response.status_code == 200:
             return response.json()
         return []
@@ -178,8 +214,10 @@ def get_equipos_por_ubicacion():
         return []
 
 def get_equipos_por_estado():
+    if "por_estado" in batch_data:
+        return batch_data["por_estado"]
     try:
-        response = requests.get(f"{API_URL}/api/reportes/equipos-por-estado", timeout=10)
+        response = conditional_get(f"{API_URL}/api/reportes/equipos-por-estado", timeout=10)
         if response.status_code == 200:
             return response.json()
         return []
@@ -187,8 +225,10 @@ def get_equipos_por_estado():
         return []
 
 def get_equipos_por_categoria():
+    if "por_categoria" in batch_data:
+        return batch_data["por_categoria"]
     try:
-        response = requests.get(f"{API_URL}/api/reportes/equipos-por-categoria", timeout=10)
+        response = conditional_get(f"{API_URL}/api/reportes/equipos-por-categoria", timeout=10)
         if response.status_code == 200:
             return response.json()
         return []
@@ -196,9 +236,11 @@ def get_equipos_por_categoria():
         return []
 
 def get_costos_mantenimiento(year=None):
+    if year == batch_year and "costos" in batch_data:
+        return batch_data["costos"]
     params = {"year": year} if year else {}
     try:
-        response = requests.get(f"{API_URL}/api/reportes/costos-mantenimiento", params=params, timeout=10)
+        response = conditional_get(f"{API_URL}/api/reportes/costos-mantenimiento", params=params, timeout=10)
         if response.status_code == 200:
             return response.json()
         return []
@@ -215,6 +257,9 @@ def get_equipos_antiguedad(max_retries=2):
     Returns:
         dict or None: Los datos de antigüedad o None si hay un error
     """
+    if "antiguedad" in batch_data:
+        return batch_data["antiguedad"]
+
     url = f"{API_URL}/api/reportes/equipos-antiguedad"
     
     for attempt in range(max_retries + 1):
@@ -224,7 +269,7 @@ def get_equipos_antiguedad(max_retries=2):
                 st.warning(f"Reintentando... (Intento {attempt + 1}/{max_retries + 1})")
             
             # Hacer la petición con timeout
-            response = requests.get(url, timeout=15)
+            response = conditional_get(url, timeout=15)
             
             # Verificar si la respuesta es exitosa
             if response.status_code == 200:
@@ -397,7 +442,7 @@ with tab2:
     # Costos de mantenimiento
     st.markdown("### 💵 Costos de Mantenimiento")
     
-    year_selected = st.selectbox("Seleccionar Año", [2024, 2023, 2022])
+    year_selected = st.selectbox("Seleccionar Año", [2024, 2023, 2022], key="year_costos")
     data_costos = get_costos_mantenimiento(year=year_selected)
 
     if data_costos and isinstance(data_costos, list) and len(data_costos) > 0:
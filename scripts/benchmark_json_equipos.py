@@ -0,0 +1,70 @@
+"""
+Benchmark de serialización JSON del listado de equipos.
+
+Compara, con las mismas filas de GET /equipos, el camino anterior
+(dict() por fila + jsonable_encoder + JSONResponse) con FastJSONResponse
+(orjson directamente sobre las filas de asyncpg). Comprueba además que ambos
+cuerpos sean idénticos.
+
+    DATABASE_URL=postgresql://... python3 scripts/benchmark_json_equipos.py [filas] [repeticiones]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "equipos_service"))
+import main as equipos  # noqa: E402
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        body = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), body
+
+
+async def run(filas=50000, repeticiones=5):
+    conn = await asyncpg.connect(equipos.DATABASE_URL)
+    try:
+        await equipos.init_connection(conn)
+        rows = await conn.fetch(f"""
+            SELECT {equipos.EQUIPOS_LIST_COLUMNS}
+            FROM equipos e
+            {equipos.EQUIPOS_LIST_JOINS}
+            ORDER BY e.id DESC
+            LIMIT $1
+        """, filas)
+    finally:
+        await conn.close()
+
+    print(f"📦 {len(rows)} filas de equipos, mediana de {repeticiones} repeticiones")
+
+    antes, body_antes = medir(
+        lambda: JSONResponse({"items": jsonable_encoder([dict(row) for row in rows])}).body, repeticiones
+    )
+    despues, body_despues = medir(lambda: equipos.FastJSONResponse({"items": rows}).body, repeticiones)
+
+    print(f"   jsonable_encoder + json : {antes:8.1f} ms  ({len(body_antes) / 1e6:.1f} MB)")
+    print(f"   orjson sobre Records    : {despues:8.1f} ms  ({len(body_despues) / 1e6:.1f} MB)")
+    print(f"   mejora                  : {antes / despues:8.1f}x")
+
+    # json.dumps de Starlette separa con ",", ":" igual que orjson
+    if body_antes != body_despues:
+        print("❌ Los cuerpos no coinciden")
+        return False
+    print("✅ Cuerpos idénticos")
+    return True
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    veces = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sys.exit(0 if asyncio.run(run(cantidad, veces)) else 1)
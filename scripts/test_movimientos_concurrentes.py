@@ -0,0 +1,116 @@
+"""
+Prueba de concurrencia de POST /movimientos.
+
+Lanza muchos movimientos en paralelo sobre el mismo equipo y comprueba que los
+movimientos nuevos queden encadenados: el primero sale de la ubicación previa,
+cada uno sale de donde llegó el anterior, fecha_hasta apunta al siguiente y el
+último destino es la ubicación actual. No debe haber otros movimientos del
+equipo mientras corre la prueba.
+
+    python3 scripts/test_movimientos_concurrentes.py [equipo_id] [movimientos]
+
+Desde el contenedor del gateway:
+    docker-compose exec api-gateway python3 /scripts/test_movimientos_concurrentes.py
+"""
+import asyncio
+import os
+import random
+import sys
+
+import httpx
+
+EQUIPOS_API_URL = os.getenv("EQUIPOS_API_URL", "http://localhost:8000/api/equipos")
+USUARIO_ID = int(os.getenv("USUARIO_ID", "1"))
+
+
+async def fetch_historial(client, equipo_id):
+    """Historial completo, del más antiguo al más reciente."""
+    items, cursor = [], None
+    while True:
+        params = {"limit": 500}
+        if cursor:
+            params["cursor"] = cursor
+        r = await client.get(f"/equipos/{equipo_id}/movimientos", params=params)
+        r.raise_for_status()
+        page = r.json()
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return list(reversed(items))
+
+
+async def run(equipo_id=None, total=50):
+    async with httpx.AsyncClient(base_url=EQUIPOS_API_URL, timeout=30) as client:
+        ubicaciones = [u["id"] for u in (await client.get("/ubicaciones")).json()]
+        if len(ubicaciones) < 2:
+            raise RuntimeError("Se necesitan al menos dos ubicaciones activas")
+
+        if equipo_id is None:
+            r = await client.get("/equipos", params={"limit": 1, "fields": "id"})
+            equipo_id = r.json()["items"][0]["id"]
+
+        r = await client.get(f"/equipos/{equipo_id}", params={"fields": "ubicacion_actual_id"})
+        r.raise_for_status()
+        inicial = r.json()["ubicacion_actual_id"]
+
+        print(f"🚚 Enviando {total} movimientos concurrentes del equipo {equipo_id} ...")
+
+        async def mover(n):
+            r = await client.post("/movimientos", json={
+                "equipo_id": equipo_id,
+                "ubicacion_destino_id": random.choice(ubicaciones),
+                "usuario_responsable_id": USUARIO_ID,
+                "motivo": f"prueba de concurrencia {n}",
+            })
+            r.raise_for_status()
+            return r.json()["id"]
+
+        creados = set(await asyncio.gather(*[mover(n) for n in range(total)]))
+
+        historial = await fetch_historial(client, equipo_id)
+        actual = (await client.get(f"/equipos/{equipo_id}", params={"fields": "ubicacion_actual_id"})).json()
+
+    errores = []
+    faltantes = creados - {m["id"] for m in historial}
+    if faltantes:
+        errores.append(f"movimientos no encontrados en el historial: {sorted(faltantes)}")
+
+    # Desde el movimiento previo a la prueba (si existe) hasta el final
+    primero = min(i for i, m in enumerate(historial) if m["id"] in creados)
+    cadena = historial[max(primero - 1, 0):]
+    if primero == 0 and cadena[0]["ubicacion_origen_id"] != inicial:
+        errores.append(f"el primer movimiento sale de {cadena[0]['ubicacion_origen_id']}, no de {inicial}")
+    if primero > 0 and cadena[0]["ubicacion_destino_id"] != inicial:
+        errores.append(f"la ubicación previa ({inicial}) no coincide con el último movimiento anterior")
+    if len(cadena) - (primero > 0) != len(creados):
+        errores.append("hay movimientos ajenos a la prueba intercalados")
+
+    for anterior, siguiente in zip(cadena, cadena[1:]):
+        if siguiente["ubicacion_origen_id"] != anterior["ubicacion_destino_id"]:
+            errores.append(
+                f"movimiento {siguiente['id']}: origen {siguiente['ubicacion_origen_id']}, "
+                f"pero el anterior ({anterior['id']}) llegó a {anterior['ubicacion_destino_id']}"
+            )
+        if anterior.get("fecha_hasta") != siguiente["fecha_movimiento"]:
+            errores.append(f"movimiento {anterior['id']}: fecha_hasta no coincide con el siguiente")
+
+    if historial[-1]["ubicacion_destino_id"] != actual["ubicacion_actual_id"]:
+        errores.append(
+            f"ubicación actual {actual['ubicacion_actual_id']} distinta del último destino "
+            f"{historial[-1]['ubicacion_destino_id']}"
+        )
+
+    if errores:
+        print(f"❌ Historial inconsistente ({len(errores)} errores):")
+        for error in errores[:20]:
+            print("   -", error)
+        return False
+
+    print(f"✅ {len(creados)} movimientos concurrentes registrados y encadenados correctamente.")
+    return True
+
+
+if __name__ == "__main__":
+    equipo = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    cantidad = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sys.exit(0 if asyncio.run(run(equipo, cantidad)) else 1)
@@ -1,16 +1,65 @@
 from fastapi import FastAPI, BackgroundTasks
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import List
 import asyncpg
 import os
+import sys
 from datetime import datetime, date, timedelta
 import asyncio
 
-app = FastAPI(title="Agent Service", version="1.0.0")
+# services/common: en la imagen está junto a main.py; en local, un nivel arriba
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.db import PoolTimeout, acquire_conn, create_pool, pool_status, pool_timeout_handler
+from common.responses import FastJSONResponse
+from common.tracing import TracingMiddleware, record_query_span, router as traces_router, stop_trace_file
+
+app = FastAPI(title="Agent Service", version="1.0.0", default_response_class=FastJSONResponse)
+
+# Compresión gzip de respuestas grandes (listados y reportes) hacia el gateway
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# -----------------------------
+# TRAZAS (request-id, spans de handler y de SQL)
+# -----------------------------
+SERVICE_NAME = "agents"
+
+
+async def init_connection(conn):
+    conn.add_query_logger(record_query_span)
+
+
+app.add_middleware(TracingMiddleware, service=SERVICE_NAME)
+app.include_router(traces_router)
+
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# -----------------------------
+# POOL GLOBAL
+# -----------------------------
+pool = None
+
+@app.on_event("startup")
+async def startup_event():
+    global pool
+    pool = await create_pool(DATABASE_URL, init=init_connection)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if pool:
+        await pool.close()
+    stop_trace_file()
+
 async def get_db_pool():
-    return await asyncpg.create_pool(DATABASE_URL)
+    return pool
+
+app.add_exception_handler(PoolTimeout, pool_timeout_handler)
+
+@app.get("/health/db")
+async def pool_health():
+    return pool_status(pool)
+# -----------------------------
 
 @app.get("/health")
 async def health_check():
@@ -23,7 +72,7 @@ async def crear_notificacion(pool, tipo: str, titulo: str, mensaje: str,
         INSERT INTO notificaciones (tipo, titulo, mensaje, equipo_id, mantenimiento_id)
         VALUES ($1, $2, $3, $4, $5)
     """
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         await conn.execute(query, tipo, titulo, mensaje, equipo_id, mantenimiento_id)
 
 @app.post("/check-maintenance")
@@ -40,7 +89,7 @@ async def check_maintenance_reminders():
         fecha_limite_7dias = hoy + timedelta(days=7)
         fecha_limite_3dias = hoy + timedelta(days=3)
         
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             # Mantenimientos próximos (7 días)
             mantenimientos_proximos = await conn.fetch("""
                 SELECT m.id, m.fecha_programada, m.descripcion,
@@ -125,6 +174,8 @@ async def check_maintenance_reminders():
             "fecha_ejecucion": datetime.now().isoformat()
         }
     
+    except PoolTimeout:
+        raise
     except Exception as e:
         return {
             "status": "error",
@@ -141,7 +192,7 @@ async def check_equipment_obsolescence():
     notificaciones_generadas = 0
     
     try:
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             # Equipos que superan la vida útil
             equipos_obsoletos = await conn.fetch("""
                 SELECT e.id, e.nombre, e.codigo_inventario, e.fecha_compra,
@@ -204,6 +255,8 @@ async def check_equipment_obsolescence():
             "fecha_ejecucion": datetime.now().isoformat()
         }
     
+    except PoolTimeout:
+        raise
     except Exception as e:
         return {
             "status": "error",
@@ -223,7 +276,7 @@ async def check_warranty_expiration():
         hoy = date.today()
         fecha_limite = hoy + timedelta(days=60)
         
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             equipos_garantia_proxima = await conn.fetch("""
                 SELECT e.id, e.nombre, e.codigo_inventario, e.fecha_garantia_fin,
                        p.razon_social as proveedor
@@ -257,6 +310,8 @@ async def check_warranty_expiration():
             "fecha_ejecucion": datetime.now().isoformat()
         }
     
+    except PoolTimeout:
+        raise
     except Exception as e:
         return {
             "status": "error",
@@ -273,7 +328,7 @@ async def analyze_maintenance_costs():
     alertas = []
     
     try:
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             # Equipos con alto costo de mantenimiento
             equipos_alto_costo = await conn.fetch("""
                 SELECT e.id, e.nombre, e.codigo_inventario, e.costo_compra,
@@ -314,6 +369,8 @@ async def analyze_maintenance_costs():
             "fecha_ejecucion": datetime.now().isoformat()
         }
     
+    except PoolTimeout:
+        raise
     except Exception as e:
         return {
             "status": "error",
@@ -335,16 +392,16 @@ async def get_notificaciones(leida: bool = False, limit: int = 50):
         LIMIT $2
     """
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query, leida, limit)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 @app.put("/notificaciones/{notif_id}/marcar-leida")
 async def marcar_notificacion_leida(notif_id: int):
     """Marca una notificación como leída"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         await conn.execute(
             "UPDATE notificaciones SET leida = TRUE, fecha_lectura = CURRENT_TIMESTAMP WHERE id = $1",
             notif_id
@@ -1,8 +1,40 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+import asyncio
+import bisect
 import httpx
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import orjson
+import os
+import random
+import time
+import zlib
 
-app = FastAPI(title="API Gateway", version="1.0")
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se usa solo gzip
+    brotli = None
+
+# -------------------------------
+# RESPUESTAS JSON (orjson)
+# -------------------------------
+class FastJSONResponse(JSONResponse):
+    """JSON serializado con orjson; respuesta por defecto de las rutas propias del gateway."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(title="API Gateway", version="1.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,49 +44,1161 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MAPA DE MICROSERVICIOS
+# -------------------------------
+# COMPRESIÓN DE RESPUESTAS
+# -------------------------------
+GATEWAY_COMPRESSION_MIN_SIZE = int(os.getenv("GATEWAY_COMPRESSION_MIN_SIZE", "1000"))
+
+# Tipos que ya vienen comprimidos o que no deben acumularse (SSE)
+NO_COMPRESS_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def accepted_encodings(header: str) -> set:
+    """Codificaciones aceptadas en Accept-Encoding (ignora las que tienen q=0)."""
+    accepted = set()
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name)
+    return accepted
+
+
+def upstream_encoding(headers) -> str:
+    """Lo que se pide al backend: gzip si el cliente la acepta, así el cuerpo se reenvía tal cual."""
+    return "gzip" if "gzip" in accepted_encodings(headers.get("accept-encoding", "")) else "identity"
+
+
+def add_vary(headers: MutableHeaders, token: str):
+    """Añade token a Vary solo si no está ya (sin distinguir mayúsculas)."""
+    present = {t.strip().lower() for t in headers.get("vary", "").split(",")}
+    if token.lower() not in present and "*" not in present:
+        headers.add_vary_header(token)
+
+
+class CompressionMiddleware:
+    """Comprime con brotli (si está instalado) o gzip las respuestas que el backend no comprimió."""
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        accepted = accepted_encodings(accept)
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                small = not more_body and len(body) < self.minimum_size
+                if "content-encoding" in headers or small or content_type.startswith(NO_COMPRESS_TYPES):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = (
+                    brotli.Compressor(quality=5) if encoding == "br"
+                    else zlib.compressobj(6, zlib.DEFLATED, 31)
+                )
+                headers["content-encoding"] = encoding
+                add_vary(headers, "Accept-Encoding")
+                # El cuerpo cambia de bytes: un ETag fuerte del backend pasa a débil
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["etag"] = "W/" + etag
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send(start)
+
+            if encoding == "br":
+                data = compressor.process(body) + (b"" if more_body else compressor.finish())
+            else:
+                data = compressor.compress(body) + (b"" if more_body else compressor.flush())
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+app.add_middleware(CompressionMiddleware, minimum_size=GATEWAY_COMPRESSION_MIN_SIZE)
+
+
+# -------------------------------
+# TRAZAS (request-id y traceparent hacia los servicios)
+# -------------------------------
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+# Si se define, cada span se añade también como una línea JSON a este archivo
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+trace_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+current_span = ContextVar("current_span", default=None)
+
+# El archivo se escribe desde el hilo de un QueueListener: el event loop solo encola la línea
+trace_file_logger = None
+trace_file_listener = None
+if TRACE_FILE:
+    trace_file_queue = SimpleQueue()
+    trace_file_listener = QueueListener(trace_file_queue, logging.FileHandler(TRACE_FILE, encoding="utf-8"))
+    trace_file_listener.start()
+    trace_file_logger = logging.getLogger("trazas")
+    trace_file_logger.setLevel(logging.INFO)
+    trace_file_logger.propagate = False
+    trace_file_logger.addHandler(QueueHandler(trace_file_queue))
+
+
+def parse_traceparent(value):
+    """(trace_id, parent_span_id) de una cabecera W3C traceparent; genera un trace nuevo si no es válida."""
+    parts = (value or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return os.urandom(16).hex(), None
+
+
+def record_span(span: dict):
+    trace_spans.append(span)
+    if trace_file_logger:
+        trace_file_logger.info(json.dumps(span, default=str))
+
+
+def trace_headers(headers: dict) -> dict:
+    """Sustituye traceparent y X-Request-ID por los del span actual del gateway."""
+    span = current_span.get()
+    if span is not None:
+        headers["traceparent"] = f"00-{span['trace_id']}-{span['span_id']}-01"
+        headers["x-request-id"] = span["request_id"]
+    return headers
+
+
+class TracingMiddleware:
+    """Span por petición; el X-Request-ID del cliente se respeta o se genera uno nuevo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        trace_id, parent_id = parse_traceparent(headers.get("traceparent"))
+        request_id = headers.get("x-request-id") or trace_id
+        span = {
+            "trace_id": trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_id": parent_id,
+            "request_id": request_id,
+            "service": "gateway",
+            "name": f"{scope['method']} {scope['path']}",
+            "start": time.time(),
+            "status": None,
+        }
+        token = current_span.set(span)
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                span["status"] = message["status"]
+                # Se fija (no se añade): la respuesta del backend ya trae el suyo
+                MutableHeaders(scope=message)["x-request-id"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            span["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            current_span.reset(token)
+            record_span(span)
+
+
+app.add_middleware(TracingMiddleware)
+
+
+def service_urls(env_var: str, default: str) -> list:
+    """Lista de instancias de un servicio; varias URLs se separan con comas."""
+    return [url.strip().rstrip("/") for url in os.getenv(env_var, default).split(",") if url.strip()]
+
+
+# MAPA DE MICROSERVICIOS (cada servicio puede tener varias réplicas)
 SERVICE_MAP = {
-    "equipos": "http://equipos-service:8001",
-    "proveedores": "http://proveedores-service:8002",
-    "mantenimientos": "http://mantenimiento-service:8003",
-    "reportes": "http://reportes-service:8004",
-    "agents": "http://agent-service:8005",
+    "equipos": service_urls("EQUIPOS_SERVICE_URL", "http://equipos-service:8001"),
+    "proveedores": service_urls("PROVEEDORES_SERVICE_URL", "http://proveedores-service:8002"),
+    "mantenimientos": service_urls("MANTENIMIENTO_SERVICE_URL", "http://mantenimiento-service:8003"),
+    "reportes": service_urls("REPORTES_SERVICE_URL", "http://reportes-service:8004"),
+    "agents": service_urls("AGENT_SERVICE_URL", "http://agent-service:8005"),
+}
+
+# -------------------------------
+# CLIENTES HTTP PERSISTENTES
+# -------------------------------
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+GATEWAY_MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+GATEWAY_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+
+# Modo streaming: reenvía status, cabeceras y cuerpo por bloques sin parsear el JSON.
+# Con GATEWAY_STREAMING=false se conserva el modo anterior (parsear y re-serializar).
+GATEWAY_STREAMING = os.getenv("GATEWAY_STREAMING", "true").lower() == "true"
+
+# Timeouts (connect, read) en segundos por servicio.
+# Se pueden sobreescribir con GATEWAY_TIMEOUT_<SERVICIO>="connect,read"
+SERVICE_TIMEOUTS = {
+    "equipos": (3.0, 15.0),
+    "proveedores": (3.0, 15.0),
+    "mantenimientos": (3.0, 15.0),
+    "reportes": (3.0, 120.0),
+    "agents": (3.0, 60.0),
+}
+
+# Cabeceras hop-by-hop que no deben reenviarse en ninguna dirección; date y server
+# las pone el propio servidor del gateway (reenviarlas las duplicaría)
+HOP_BY_HOP_HEADERS = {
+    "host", "connection", "keep-alive", "proxy-connection", "te",
+    "trailer", "transfer-encoding", "upgrade", "date", "server",
 }
 
+# Métodos cuyo cuerpo se envía al backend
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+clients = {}
+health_task = None
+
+
+def service_timeout(service: str) -> httpx.Timeout:
+    connect, read = SERVICE_TIMEOUTS.get(service, (3.0, 30.0))
+    override = os.getenv(f"GATEWAY_TIMEOUT_{service.upper()}")
+    if override:
+        connect, read = (float(v) for v in override.split(","))
+    return httpx.Timeout(read, connect=connect)
+
+
+# -------------------------------
+# INSTANCIAS, BALANCEO Y HEALTH CHECKS
+# -------------------------------
+GATEWAY_HEALTH_INTERVAL = float(os.getenv("GATEWAY_HEALTH_INTERVAL", "5"))
+GATEWAY_HEALTH_TIMEOUT = float(os.getenv("GATEWAY_HEALTH_TIMEOUT", "2"))
+GATEWAY_HEALTH_FAILS = int(os.getenv("GATEWAY_HEALTH_FAILS", "2"))
+GATEWAY_HEALTH_PASSES = int(os.getenv("GATEWAY_HEALTH_PASSES", "2"))
+
+
+class Upstream:
+    """Instancia de un servicio: peticiones pendientes y estado según los probes de /health."""
+
+    def __init__(self, service: str, url: str):
+        self.service = service
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.probe_fails = 0
+        self.probe_passes = 0
+
+    def record_probe(self, ok: bool):
+        if ok:
+            self.probe_fails = 0
+            self.probe_passes += 1
+            if not self.healthy and self.probe_passes >= GATEWAY_HEALTH_PASSES:
+                logger.warning("Instancia %s de '%s' vuelve a rotación", self.url, self.service)
+                self.healthy = True
+        else:
+            self.probe_passes = 0
+            self.probe_fails += 1
+            if self.healthy and self.probe_fails >= GATEWAY_HEALTH_FAILS:
+                logger.warning("Instancia %s de '%s' fuera de rotación", self.url, self.service)
+                self.healthy = False
+
+
+upstreams = {
+    service: [Upstream(service, url) for url in urls]
+    for service, urls in SERVICE_MAP.items()
+}
+
+
+def pick_upstream(service: str, usable=None) -> Optional[Upstream]:
+    """Menor número de peticiones pendientes entre las instancias sanas (empate al azar).
+
+    usable descarta además instancias (p. ej. con el circuito abierto); None si no queda ninguna.
+    """
+    instances = [u for u in upstreams[service] if usable is None or usable(u)]
+    if not instances:
+        return None
+    # Si ninguna instancia pasa el health check se usan todas: el circuit breaker decide
+    candidates = [u for u in instances if u.healthy] or instances
+    least = min(u.outstanding for u in candidates)
+    return random.choice([u for u in candidates if u.outstanding == least])
+
+
+async def probe_upstream(upstream: Upstream):
+    try:
+        resp = await clients[upstream.service].get(f"{upstream.url}/health", timeout=GATEWAY_HEALTH_TIMEOUT)
+        ok = resp.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    upstream.record_probe(ok)
+
+
+async def health_check_loop():
+    while True:
+        await asyncio.gather(*[
+            probe_upstream(upstream)
+            for instances in upstreams.values()
+            for upstream in instances
+        ])
+        await asyncio.sleep(GATEWAY_HEALTH_INTERVAL)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global health_task, event_stream_client
+    limits = httpx.Limits(
+        max_connections=GATEWAY_MAX_CONNECTIONS,
+        max_keepalive_connections=GATEWAY_MAX_KEEPALIVE,
+        keepalive_expiry=GATEWAY_KEEPALIVE_EXPIRY,
+    )
+    for service in SERVICE_MAP:
+        clients[service] = httpx.AsyncClient(
+            limits=limits,
+            timeout=service_timeout(service),
+        )
+        bulkheads[service] = asyncio.Semaphore(GATEWAY_MAX_INFLIGHT_PER_SERVICE)
+    event_stream_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=GATEWAY_MAX_EVENT_STREAMS, max_keepalive_connections=0),
+        timeout=httpx.Timeout(None, connect=GATEWAY_EVENT_STREAM_CONNECT_TIMEOUT),
+    )
+    health_task = asyncio.create_task(health_check_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if health_task:
+        health_task.cancel()
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+    if event_stream_client:
+        await event_stream_client.aclose()
+    if trace_file_listener:
+        trace_file_listener.stop()
+
+
+# -------------------------------
+# CACHE DE RESPUESTAS GET
+# -------------------------------
+GATEWAY_CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# TTL en segundos por ruta "<servicio>/<path>". Las rutas que no aparecen no se cachean.
+CACHE_TTLS = {
+    "equipos/categorias": 300,
+    "equipos/ubicaciones": 300,
+    "proveedores/proveedores": 120,
+    "reportes/dashboard": 30,
+    "reportes/equipos-por-ubicacion": 60,
+    "reportes/equipos-por-estado": 60,
+    "reportes/equipos-por-categoria": 60,
+    "reportes/equipos-antiguedad": 300,
+    "reportes/costos-mantenimiento": 120,
+    "reportes/mantenimientos-por-prioridad": 60,
+    "reportes/equipos-garantia": 300,
+}
+
+# Una escritura en un servicio también invalida los servicios que leen sus tablas
+CACHE_DEPENDENCIES = {
+    "equipos": {"reportes"},
+    "proveedores": {"equipos", "reportes"},
+    "mantenimientos": {"reportes"},
+}
+
+# Los mismos métodos de escritura que acepta api_proxy
+WRITE_METHODS = {"POST", "PUT", "DELETE"}
+
+
+class ResponseCache:
+    """Cache LRU acotada por tamaño total en bytes, con expiración por entrada."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generations = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def generation(self, service: str) -> int:
+        return self.generations.get(service, 0)
+
+    def set(self, key, value, ttl: float, generation: int):
+        # Si hubo una escritura mientras se consultaba el backend, el valor puede estar obsoleto
+        body_size = len(value[2])
+        if body_size > self.max_bytes or generation != self.generation(key[0]):
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.size += body_size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, service: str):
+        self.generations[service] = self.generation(service) + 1
+        for key in [k for k in self.entries if k[0] == service]:
+            self._remove(key)
+            self.stats["invalidations"] += 1
+
+    def _remove(self, key):
+        _, value = self.entries.pop(key)
+        self.size -= len(value[2])
+
+
+response_cache = ResponseCache(GATEWAY_CACHE_MAX_BYTES)
+
+
+def cache_ttl(service: str, path: str):
+    return CACHE_TTLS.get(f"{service}/{path.strip('/')}")
+
+
+# Peticiones GET en curso por (servicio, path, query): las idénticas esperan la misma llamada
+inflight = {}
+coalesce_stats = {"upstream": 0, "coalesced": 0}
+
+
+# -------------------------------
+# RESILIENCIA: CIRCUIT BREAKER, BULKHEAD Y REINTENTOS
+# -------------------------------
+GATEWAY_BREAKER_FAILURES = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+GATEWAY_BREAKER_RESET = float(os.getenv("GATEWAY_BREAKER_RESET", "30"))
+GATEWAY_MAX_INFLIGHT_PER_SERVICE = int(os.getenv("GATEWAY_MAX_INFLIGHT_PER_SERVICE", "50"))
+GATEWAY_BULKHEAD_WAIT = float(os.getenv("GATEWAY_BULKHEAD_WAIT", "0.5"))
+GATEWAY_RETRIES = int(os.getenv("GATEWAY_RETRIES", "2"))
+GATEWAY_RETRY_BACKOFF = float(os.getenv("GATEWAY_RETRY_BACKOFF", "0.1"))
+# Fracción de las peticiones que se puede gastar en reintentos (evita tormentas de reintentos)
+GATEWAY_RETRY_BUDGET = float(os.getenv("GATEWAY_RETRY_BUDGET", "0.2"))
+
+# Respuestas del backend que cuentan como fallo y que se pueden reintentar en GET
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+def is_load_shed(resp: httpx.Response) -> bool:
+    """503 con Retry-After: el servicio rechaza por carga (pool saturado), la instancia sí responde."""
+    return resp.status_code == 503 and "retry-after" in resp.headers
+
+logger = logging.getLogger("api-gateway")
+
+
+class CircuitBreaker:
+    """closed -> open tras N fallos seguidos; open -> half_open tras el reset; una prueba decide.
+
+    Hay uno por instancia: una réplica caída no corta el tráfico a las demás.
+    """
+
+    def __init__(self, service: str, url: str):
+        self.service = service
+        self.url = url
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.transitions = 0
+
+    def available(self) -> bool:
+        """Si allow() dejaría pasar una petición, sin ocupar la prueba de half_open."""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= GATEWAY_BREAKER_RESET
+        return not (self.state == "half_open" and self.trial_in_flight)
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < GATEWAY_BREAKER_RESET:
+                return False
+            self._transition("half_open")
+        if self.state == "half_open":
+            if self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+        if self.state != "closed":
+            self._transition("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= GATEWAY_BREAKER_FAILURES:
+            self.opened_at = time.monotonic()
+            if self.state != "open":
+                self._transition("open")
+
+    def _transition(self, state: str):
+        logger.warning("Circuito de '%s' (%s): %s -> %s", self.service, self.url, self.state, state)
+        self.state = state
+        self.transitions += 1
+
+
+breakers = {
+    service: {u.url: CircuitBreaker(service, u.url) for u in instances}
+    for service, instances in upstreams.items()
+}
+bulkheads = {}
+upstream_inflight = {service: 0 for service in SERVICE_MAP}
+retry_tokens = {service: 10.0 for service in SERVICE_MAP}
+resilience_stats = {
+    service: {
+        "rejected_breaker": 0,
+        "rejected_bulkhead": 0,
+        "retries": 0,
+        "retry_budget_exhausted": 0,
+        "failures": 0,
+    }
+    for service in SERVICE_MAP
+}
+
+
+def take_retry_token(service: str) -> bool:
+    if retry_tokens[service] < 1:
+        resilience_stats[service]["retry_budget_exhausted"] += 1
+        return False
+    retry_tokens[service] -= 1
+    return True
+
+
+def release_upstream(service: str, instance: Upstream):
+    instance.outstanding -= 1
+    upstream_inflight[service] -= 1
+    bulkheads[service].release()
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok", "service": "api-gateway"}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        **response_cache.stats,
+        "entries": len(response_cache.entries),
+        "bytes": response_cache.size,
+        "max_bytes": response_cache.max_bytes,
+        "inflight": len(inflight),
+        **coalesce_stats,
+    }
+
+
+@app.get("/upstreams")
+async def upstreams_status():
+    return {
+        service: [
+            {
+                "url": u.url,
+                "healthy": u.healthy,
+                "outstanding": u.outstanding,
+                "requests": u.requests,
+            }
+            for u in instances
+        ]
+        for service, instances in upstreams.items()
+    }
+
+
+@app.get("/resilience/stats")
+async def resilience_status():
+    return {
+        service: {
+            "circuits": {
+                url: {
+                    "state": breaker.state,
+                    "consecutive_failures": breaker.failures,
+                    "transitions": breaker.transitions,
+                }
+                for url, breaker in breakers[service].items()
+            },
+            "inflight": upstream_inflight[service],
+            "retry_tokens": round(retry_tokens[service], 2),
+            **resilience_stats[service],
+        }
+        for service in SERVICE_MAP
+    }
+
+
+@app.get("/traces")
+async def get_traces(trace_id: Optional[str] = None, request_id: Optional[str] = None, limit: int = 200):
+    """Spans recientes del gateway, filtrables por trace o request-id."""
+    spans = [
+        s for s in list(trace_spans)
+        if (trace_id is None or s["trace_id"] == trace_id)
+        and (request_id is None or s["request_id"] == request_id)
+    ]
+    return spans[-limit:]
+
+
+# -------------------------------
+# MÉTRICAS (formato Prometheus)
+# -------------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Límite de rutas distintas por servicio para acotar la cardinalidad de las etiquetas
+METRICS_MAX_ROUTES = int(os.getenv("GATEWAY_METRICS_MAX_ROUTES", "200"))
+
+
+class Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(LATENCY_BUCKETS, value)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (service, route, method, status) -> contadores e histogramas
+request_counts = {}
+latency_total = {}
+latency_upstream = {}
+latency_overhead = {}
+# (service, method) -> peticiones en curso en el gateway
+requests_in_flight = {}
+known_routes = {}
+
+
+def route_template(service: str, path: str) -> str:
+    """Plantilla de ruta: los segmentos numéricos se agrupan como {id}."""
+    if service not in SERVICE_MAP:
+        return "other"
+    route = "/" + "/".join("{id}" if seg.isdigit() else seg for seg in path.strip("/").split("/"))
+    routes = known_routes.setdefault(service, set())
+    if route not in routes:
+        if len(routes) >= METRICS_MAX_ROUTES:
+            return "other"
+        routes.add(route)
+    return route
+
+
+def observe_request(labels: tuple, total: float, upstream: float):
+    request_counts[labels] = request_counts.get(labels, 0) + 1
+    for store, value in (
+        (latency_total, total),
+        (latency_upstream, upstream),
+        (latency_overhead, max(total - upstream, 0.0)),
+    ):
+        histogram = store.get(labels)
+        if histogram is None:
+            histogram = store[labels] = Histogram()
+        histogram.observe(value)
+
+
+BACKSLASH, QUOTE = "\\", '"'
+
+
+def format_labels(names: tuple, values: tuple, le: Optional[str] = None) -> str:
+    pairs = [(n, str(v)) for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(("le", le))
+    escaped = (f'{n}="{v.replace(BACKSLASH, BACKSLASH * 2).replace(QUOTE, BACKSLASH + QUOTE)}"' for n, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+REQUEST_LABELS = ("service", "route", "method", "status")
+
+
+def render_histogram(lines: list, name: str, help_text: str, store: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in list(store.items()):
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, histogram.buckets):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{format_labels(REQUEST_LABELS, labels, str(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels(REQUEST_LABELS, labels, '+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{format_labels(REQUEST_LABELS, labels)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{format_labels(REQUEST_LABELS, labels)} {histogram.count}")
+
+
+@app.get("/metrics")
+async def metrics():
+    lines = [
+        "# HELP gateway_requests_total Peticiones proxificadas por servicio, ruta, método y status.",
+        "# TYPE gateway_requests_total counter",
+    ]
+    for labels, value in list(request_counts.items()):
+        lines.append(f"gateway_requests_total{format_labels(REQUEST_LABELS, labels)} {value}")
+
+    lines.append("# HELP gateway_requests_in_flight Peticiones en curso en el gateway.")
+    lines.append("# TYPE gateway_requests_in_flight gauge")
+    for labels, value in list(requests_in_flight.items()):
+        lines.append(f"gateway_requests_in_flight{format_labels(('service', 'method'), labels)} {value}")
+
+    render_histogram(lines, "gateway_request_duration_seconds",
+                     "Tiempo total en el gateway hasta enviar las cabeceras de respuesta.", latency_total)
+    render_histogram(lines, "gateway_upstream_duration_seconds",
+                     "Tiempo esperando al backend (o a la llamada compartida).", latency_upstream)
+    render_histogram(lines, "gateway_overhead_duration_seconds",
+                     "Tiempo propio del gateway (total menos backend).", latency_overhead)
+
+    lines.append("# HELP gateway_cache_events_total Eventos de la cache de respuestas.")
+    lines.append("# TYPE gateway_cache_events_total counter")
+    for event, value in response_cache.stats.items():
+        lines.append(f'gateway_cache_events_total{{event="{event}"}} {value}')
+    lines.append("# HELP gateway_coalesced_requests_total Peticiones GET atendidas con la respuesta de otra idéntica en curso.")
+    lines.append("# TYPE gateway_coalesced_requests_total counter")
+    lines.append(f'gateway_coalesced_requests_total {coalesce_stats["coalesced"]}')
+
+    lines.append("# HELP gateway_circuit_open Circuito abierto (1) o no (0) por instancia.")
+    lines.append("# TYPE gateway_circuit_open gauge")
+    for service, instance_breakers in breakers.items():
+        for url, breaker in instance_breakers.items():
+            lines.append(
+                f'gateway_circuit_open{{service="{service}",instance="{url}"}} {int(breaker.state == "open")}'
+            )
+
+    lines.append("# HELP gateway_upstream_healthy Instancia en rotación (1) o fuera (0).")
+    lines.append("# TYPE gateway_upstream_healthy gauge")
+    for service, instances in upstreams.items():
+        for u in instances:
+            lines.append(f'gateway_upstream_healthy{{service="{service}",instance="{u.url}"}} {int(u.healthy)}')
+
+    lines.append("# HELP gateway_event_streams_open Streams SSE abiertos a través del gateway.")
+    lines.append("# TYPE gateway_event_streams_open gauge")
+    lines.append(f"gateway_event_streams_open {event_streams_open}")
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 # -------------------------------
 # FUNCION CENTRAL DE PROXY
 # -------------------------------
+def filter_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+NOT_MODIFIED_HEADERS = {"etag", "cache-control", "vary", "expires", "last-modified"}
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparación débil (If-None-Match): se ignora el prefijo W/
+    opaque = etag.removeprefix("W/")
+    return opaque in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+async def send_upstream(service: str, method: str, path: str, params: httpx.QueryParams,
+                        headers: dict, content=None):
+    """Envía al backend aplicando circuit breaker, bulkhead y reintentos (solo GET).
+
+    Cada intento elige, entre las instancias con el circuito cerrado, la de menos
+    peticiones pendientes; un reintento prefiere otra instancia. Devuelve
+    (instancia, respuesta) en modo stream; la respuesta ocupa un cupo del
+    bulkhead hasta que se cierra con close_upstream().
+    """
+    stats = resilience_stats[service]
+    retry_tokens[service] = min(10.0, retry_tokens[service] + GATEWAY_RETRY_BUDGET)
+    # Instancias que ya fallaron en esta petición: cada una suma un solo fallo aunque se reintente
+    failed = set()
+
+    attempt = 0
+    while True:
+        instance = (
+            pick_upstream(service, lambda u: u not in failed and breakers[service][u.url].available())
+            or pick_upstream(service, lambda u: breakers[service][u.url].available())
+        )
+        if instance is None or not breakers[service][instance.url].allow():
+            stats["rejected_breaker"] += 1
+            raise HTTPException(503, f"Servicio '{service}' no disponible (circuito abierto)")
+        breaker = breakers[service][instance.url]
+
+        try:
+            await asyncio.wait_for(bulkheads[service].acquire(), GATEWAY_BULKHEAD_WAIT)
+        except asyncio.TimeoutError:
+            breaker.trial_in_flight = False
+            stats["rejected_bulkhead"] += 1
+            raise HTTPException(503, f"Servicio '{service}' saturado, intente nuevamente")
+
+        instance.outstanding += 1
+        instance.requests += 1
+        upstream_inflight[service] += 1
+
+        try:
+            upstream = clients[service].build_request(
+                method, f"{instance.url}/{path}", params=params, headers=headers, content=content
+            )
+            resp = await clients[service].send(upstream, stream=True)
+            error = None
+        except httpx.TransportError as exc:
+            resp, error = None, exc
+        except BaseException:
+            release_upstream(service, instance)
+            breaker.trial_in_flight = False
+            raise
+
+        if error is None and resp.status_code not in RETRYABLE_STATUS:
+            breaker.record_success()
+            return instance, resp
+
+        if (error is None and is_load_shed(resp)) or instance in failed:
+            # Rechazo explícito por carga (la instancia responde) o instancia que ya sumó su fallo
+            breaker.trial_in_flight = False
+        else:
+            if not failed:
+                stats["failures"] += 1
+            failed.add(instance)
+            breaker.record_failure()
+
+        can_retry = (
+            method == "GET"
+            and attempt < GATEWAY_RETRIES
+            and take_retry_token(service)
+        )
+        if not can_retry:
+            if resp is not None:
+                return instance, resp
+            release_upstream(service, instance)
+            if isinstance(error, httpx.TimeoutException):
+                raise HTTPException(504, f"Servicio '{service}' no respondió a tiempo")
+            raise HTTPException(502, f"No se pudo conectar con el servicio '{service}'")
+
+        if resp is not None:
+            await close_upstream(service, instance, resp)
+        else:
+            release_upstream(service, instance)
+        attempt += 1
+        stats["retries"] += 1
+        # Backoff exponencial con jitter completo
+        await asyncio.sleep(random.uniform(0, GATEWAY_RETRY_BACKOFF * 2 ** attempt))
+
+
+async def close_upstream(service: str, instance: Upstream, resp: httpx.Response):
+    try:
+        await resp.aclose()
+    finally:
+        release_upstream(service, instance)
+
+
+async def relay_body(service: str, instance: Upstream, resp: httpx.Response):
+    """Reenvía el cuerpo sin descomprimir y libera la conexión aunque el cliente se desconecte."""
+    try:
+        async for chunk in resp.aiter_raw():
+            yield chunk
+    finally:
+        await close_upstream(service, instance, resp)
+
+
+async def fetch_buffered(service: str, path: str, params: httpx.QueryParams, headers: dict):
+    """GET al backend leyendo el cuerpo completo sin descomprimir: (status, headers, body)."""
+    instance, resp = await send_upstream(service, "GET", path, params, headers)
+    try:
+        body = b"".join([chunk async for chunk in resp.aiter_raw()])
+    finally:
+        await close_upstream(service, instance, resp)
+    return resp.status_code, filter_headers(resp.headers), body
+
+
+async def fetch_coalesced(key, service: str, path: str, params: httpx.QueryParams, headers: dict):
+    """Single-flight: una sola llamada al backend por clave mientras esté en curso."""
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch_buffered(service, path, params, headers))
+        inflight[key] = task
+        task.add_done_callback(lambda t: inflight.pop(key) if inflight.get(key) is t else None)
+        coalesce_stats["upstream"] += 1
+    else:
+        coalesce_stats["coalesced"] += 1
+    # shield: si el cliente que inició la llamada se desconecta, los demás siguen esperando
+    return await asyncio.shield(task)
+
+
+async def cached_get(service: str, path: str, params: httpx.QueryParams, headers: dict):
+    """GET con cache TTL y coalescing: (status, headers, body, estado de cache)."""
+    ttl = cache_ttl(service, path)
+    if not ttl:
+        return (*await fetch_buffered(service, path, params, headers), "BYPASS")
+
+    # El cuerpo se guarda tal como llegó, así que la codificación forma parte de la clave
+    key = (service, path.strip("/"), str(params), headers.get("accept-encoding", "identity"))
+    cached = response_cache.get(key)
+    if cached is not None:
+        return (*cached, "HIT")
+
+    generation = response_cache.generation(service)
+    fetched = await fetch_coalesced(key, service, path, params, headers)
+    if fetched[0] == 200:
+        response_cache.set(key, fetched, ttl, generation)
+    return (*fetched, "MISS")
+
+
+# -------------------------------
+# STREAMS DE EVENTOS (SSE)
+# -------------------------------
+# Rutas "<servicio>/<path>" de larga duración: se reenvían sin cache, sin
+# reintentos, sin timeout de lectura y fuera del bulkhead (cada stream ocuparía
+# un cupo mientras el cliente siga conectado), con su propio cliente y límite.
+EVENT_STREAM_ROUTES = {"equipos/equipos/eventos"}
+GATEWAY_MAX_EVENT_STREAMS = int(os.getenv("GATEWAY_MAX_EVENT_STREAMS", "200"))
+GATEWAY_EVENT_STREAM_CONNECT_TIMEOUT = float(os.getenv("GATEWAY_EVENT_STREAM_CONNECT_TIMEOUT", "3"))
+
+event_stream_client = None
+event_streams_open = 0
+
+
+def is_event_stream(service: str, path: str) -> bool:
+    return f"{service}/{path.strip('/')}" in EVENT_STREAM_ROUTES
+
+
+async def relay_event_stream(instance: Upstream, resp: httpx.Response):
+    """Reenvía cada bloque en cuanto llega; cierra la conexión al backend al desconectarse el cliente.
+
+    Los contadores se suben aquí dentro y no al crear la respuesta: si el
+    generador nunca llega a arrancar, no queda nada que descontar.
+    """
+    global event_streams_open
+    try:
+        event_streams_open += 1
+        instance.outstanding += 1
+        async for chunk in resp.aiter_raw():
+            yield chunk
+    finally:
+        event_streams_open -= 1
+        instance.outstanding -= 1
+        await resp.aclose()
+
+
+async def forward_event_stream(service: str, path: str, params: httpx.QueryParams, headers: dict):
+    if event_streams_open >= GATEWAY_MAX_EVENT_STREAMS:
+        raise HTTPException(503, "Demasiados streams de eventos abiertos, intente nuevamente")
+
+    # Mismo criterio que send_upstream: solo instancias con el circuito cerrado
+    instance = pick_upstream(service, lambda u: breakers[service][u.url].available())
+    if instance is None or not breakers[service][instance.url].allow():
+        resilience_stats[service]["rejected_breaker"] += 1
+        raise HTTPException(503, f"Servicio '{service}' no disponible (circuito abierto)")
+    breaker = breakers[service][instance.url]
+
+    instance.requests += 1
+    upstream = event_stream_client.build_request("GET", f"{instance.url}/{path}", params=params, headers=headers)
+    try:
+        resp = await event_stream_client.send(upstream, stream=True)
+    except httpx.TransportError:
+        breaker.record_failure()
+        raise HTTPException(502, f"No se pudo conectar con el servicio '{service}'")
+    except BaseException:
+        breaker.trial_in_flight = False
+        raise
+
+    if resp.status_code not in RETRYABLE_STATUS:
+        breaker.record_success()
+    elif is_load_shed(resp):
+        breaker.trial_in_flight = False
+    else:
+        breaker.record_failure()
+
+    return StreamingResponse(
+        relay_event_stream(instance, resp),
+        status_code=resp.status_code,
+        headers=filter_headers(resp.headers),
+    )
+
+
 async def forward(service: str, path: str, request: Request):
     if service not in SERVICE_MAP:
         raise HTTPException(404, f"Servicio '{service}' no existe")
 
-    url = f"{SERVICE_MAP[service]}/{path}"
+    headers = trace_headers(filter_headers(request.headers))
+    # Siempre explícito: si no, httpx añade su Accept-Encoding por defecto
+    headers["accept-encoding"] = upstream_encoding(request.headers)
+    params = httpx.QueryParams(request.query_params.multi_items())
+
+    if request.method == "GET" and is_event_stream(service, path):
+        return await forward_event_stream(service, path, params, headers)
 
-    async with httpx.AsyncClient() as client:
+    if not GATEWAY_STREAMING:
         body = await request.body()
-        resp = await client.request(
-            request.method,
-            url,
-            content=body,
-            headers=dict(request.headers)
-        )
+        started = time.perf_counter()
+        instance, resp = await send_upstream(service, request.method, path, params, headers, body)
+        try:
+            await resp.aread()
+        finally:
+            await close_upstream(service, instance, resp)
+        request.state.upstream_seconds = time.perf_counter() - started
+
+        # Si la respuesta no es JSON, devolver raw
+        try:
+            return resp.json()
+        except:
+            return {"raw": resp.text}
+
+    if request.method == "GET" and cache_ttl(service, path):
+        # La respuesta cacheada se comparte entre clientes: la condición se evalúa aquí
+        for conditional in CONDITIONAL_HEADERS:
+            headers.pop(conditional, None)
+        started = time.perf_counter()
+        status_code, resp_headers, body, cache_status = await cached_get(service, path, params, headers)
+        if cache_status != "HIT":
+            request.state.upstream_seconds = time.perf_counter() - started
+        etag = resp_headers.get("etag")
+        if status_code == 200 and etag_matches(request.headers.get("if-none-match"), etag):
+            not_modified = {k: v for k, v in resp_headers.items() if k in NOT_MODIFIED_HEADERS}
+            return Response(status_code=304, headers={**not_modified, "X-Cache": cache_status})
+        return Response(body, status_code=status_code, headers={**resp_headers, "X-Cache": cache_status})
+
+    # El cuerpo de la petición se envía al backend a medida que llega
+    content = request.stream() if request.method in BODY_METHODS else None
+    started = time.perf_counter()
+    instance, resp = await send_upstream(service, request.method, path, params, headers, content)
+    request.state.upstream_seconds = time.perf_counter() - started
+
+    return StreamingResponse(
+        relay_body(service, instance, resp),
+        status_code=resp.status_code,
+        headers=filter_headers(resp.headers),
+    )
+
+
+# -------------------------------
+# PETICIONES AGRUPADAS (BATCH)
+# -------------------------------
+GATEWAY_BATCH_MAX = int(os.getenv("GATEWAY_BATCH_MAX", "20"))
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    service: str
+    path: str
+    params: Dict[str, Any] = {}
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
+async def run_batch_item(item: BatchItem, headers: dict):
+    if item.service not in SERVICE_MAP:
+        return {"id": item.id, "status": 404, "body": {"detail": f"Servicio '{item.service}' no existe"}}
+    # Un stream no termina nunca: dejaría el lote entero esperando
+    if is_event_stream(item.service, item.path):
+        return {"id": item.id, "status": 400, "body": {"detail": "Los streams de eventos no se admiten en un lote"}}
+
+    params = httpx.QueryParams({k: v for k, v in item.params.items() if v is not None})
+    try:
+        status_code, _, body, _ = await cached_get(item.service, item.path.strip("/"), params, headers)
+    except HTTPException as exc:
+        return {"id": item.id, "status": exc.status_code, "body": {"detail": exc.detail}}
+    except httpx.HTTPError as exc:
+        # Fallo leyendo el cuerpo: afecta solo a esta parte, no al lote
+        if isinstance(exc, httpx.TimeoutException):
+            return {"id": item.id, "status": 504, "body": {"detail": f"Servicio '{item.service}' no respondió a tiempo"}}
+        return {"id": item.id, "status": 502, "body": {"detail": f"Error leyendo la respuesta del servicio '{item.service}'"}}
 
-    # Si la respuesta no es JSON, devolver raw
     try:
-        return resp.json()
-    except:
-        return {"raw": resp.text}
+        parsed = orjson.loads(body)
+    except ValueError:
+        parsed = body.decode("utf-8", errors="replace")
+    return {"id": item.id, "status": status_code, "body": parsed}
+
+
+@app.post("/api/batch")
+async def api_batch(batch: BatchRequest, request: Request):
+    """Ejecuta varias lecturas GET en paralelo y devuelve una respuesta por cada una."""
+    if len(batch.requests) > GATEWAY_BATCH_MAX:
+        raise HTTPException(400, f"Máximo {GATEWAY_BATCH_MAX} peticiones por lote")
+
+    # Las sub-respuestas se decodifican aquí, así que se piden sin compresión
+    headers = {
+        k: v for k, v in filter_headers(request.headers).items()
+        if k.lower() not in {"content-type", "content-length", "accept-encoding"}
+    }
+    headers["accept-encoding"] = "identity"
+    trace_headers(headers)
+    results = await asyncio.gather(*[run_batch_item(item, headers) for item in batch.requests])
+    return FastJSONResponse({"responses": results})
 
 
 # -------------------------------
 # RUTA PRINCIPAL QUE USA EL FRONTEND
 # /api/<service>/<path>
 # -------------------------------
+def invalidate_after_write(service: str):
+    for affected in {service} | CACHE_DEPENDENCIES.get(service, set()):
+        response_cache.invalidate(affected)
+        # Las lecturas en curso empezaron antes de la escritura: no se comparten más
+        for key in [k for k in inflight if k[0] == affected]:
+            inflight.pop(key, None)
+
+
 @app.api_route("/api/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def api_proxy(service: str, path: str, request: Request):
-    return await forward(service, path, request)
+    started = time.perf_counter()
+    metric_service = service if service in SERVICE_MAP else "unknown"
+    gauge_key = (metric_service, request.method)
+    requests_in_flight[gauge_key] = requests_in_flight.get(gauge_key, 0) + 1
+    status_code = 500
+    try:
+        response = await forward(service, path, request)
+        status_code = getattr(response, "status_code", 200)
+    except HTTPException as exc:
+        status_code = exc.status_code
+        # 502/504: la petición pudo llegar al backend y confirmarse aunque la respuesta se perdiera
+        if request.method in WRITE_METHODS and status_code in (502, 504):
+            invalidate_after_write(service)
+        raise
+    finally:
+        requests_in_flight[gauge_key] -= 1
+        observe_request(
+            (metric_service, route_template(service, path), request.method, status_code),
+            time.perf_counter() - started,
+            getattr(request.state, "upstream_seconds", 0.0),
+        )
+
+    # Invalidar después de la escritura para no repoblar la cache con datos previos;
+    # una escritura rechazada (4xx/5xx) no cambió nada
+    if request.method in WRITE_METHODS and 200 <= status_code < 300:
+        invalidate_after_write(service)
+
+    return response
@@ -0,0 +1,5 @@
+"""Código compartido por los servicios FastAPI (equipos, proveedores, mantenimiento, reportes y agents).
+
+Cada imagen copia este paquete junto a su main.py (el contexto de build es
+services/, ver docker-compose.yml); en local main.py añade services/ al path.
+"""
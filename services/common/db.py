@@ -0,0 +1,74 @@
+"""Pool de asyncpg: tamaño configurable y espera acotada por una conexión (503 si el pool se satura)."""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import asyncpg
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+
+pool_timeouts = 0
+
+
+async def create_pool(database_url: str, init=None):
+    return await asyncpg.create_pool(
+        database_url,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        init=init,
+    )
+
+
+class PoolTimeout(Exception):
+    """El pool no entregó una conexión en DB_POOL_ACQUIRE_TIMEOUT."""
+
+
+async def acquire_connection(pool):
+    """pool.acquire con timeout; solo la espera de la conexión se convierte en PoolTimeout."""
+    try:
+        return await pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeout() from None
+
+
+@asynccontextmanager
+async def acquire_conn(pool):
+    conn = await acquire_connection(pool)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # El pool no entregó una conexión a tiempo: responder 503 en lugar de encolar sin límite.
+    # Otros timeouts (consultas, llamadas salientes) siguen siendo errores del servidor
+    global pool_timeouts
+    pool_timeouts += 1
+    # Retry-After distingue este rechazo por carga de una caída: el gateway no lo cuenta como fallo
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Base de datos saturada, intente nuevamente"},
+        headers={"Retry-After": "1"},
+    )
+
+
+def pool_status(pool) -> dict:
+    """Ocupación del pool para /health/db."""
+    size = pool.get_size() if pool else 0
+    idle = pool.get_idle_size() if pool else 0
+    return {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "saturacion": round((size - idle) / DB_POOL_MAX_SIZE, 2),
+        "acquire_timeouts": pool_timeouts,
+    }
@@ -0,0 +1,56 @@
+"""ETag / GET condicional."""
+import hashlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+class ETagMiddleware:
+    """ETag débil (hash del contenido) en respuestas GET 200; 304 si coincide If-None-Match.
+
+    Es débil porque GZipMiddleware comprime después el cuerpo: gzip e identity
+    comparten el mismo valor, y If-None-Match se compara sin el prefijo W/.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        passthrough = False
+
+        async def send_with_etag(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # Solo respuestas completas en un mensaje; los streams se envían sin ETag
+            if start["status"] != 200 or message.get("more_body", False):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            opaque = '"' + hashlib.blake2b(message.get("body", b""), digest_size=16).hexdigest() + '"'
+            headers = MutableHeaders(raw=start["headers"])
+            headers["etag"] = "W/" + opaque
+
+            if if_none_match and (if_none_match.strip() == "*" or opaque in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+                del headers["content-length"]
+                del headers["content-type"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -0,0 +1,30 @@
+"""Respuestas JSON con orjson."""
+from decimal import Decimal
+
+import asyncpg
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def orjson_default(value):
+    """Tipos que orjson no serializa por sí mismo: filas de asyncpg y Decimal (como float, igual que FastAPI).
+
+    orjson no recorre Records, así que cada fila pasa por un dict plano; es la
+    única copia (antes la hacía el handler y jsonable_encoder recorría el resultado otra vez).
+    """
+    if isinstance(value, asyncpg.Record):
+        return dict(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON serializado con orjson (fechas y Decimal incluidos).
+
+    Es la respuesta por defecto de las apps; los listados además la devuelven
+    directamente con las filas de asyncpg para saltarse jsonable_encoder.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,130 @@
+"""Trazas: request-id, span por petición y spans de SQL, consultables en /traces."""
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional
+
+from fastapi import APIRouter
+from starlette.datastructures import Headers, MutableHeaders
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+# Si se define, cada span se añade también como una línea JSON a este archivo
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+trace_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+current_span = ContextVar("current_span", default=None)
+
+# El archivo se escribe desde el hilo de un QueueListener: el event loop solo encola la línea
+trace_file_logger = None
+trace_file_listener = None
+if TRACE_FILE:
+    trace_file_queue = SimpleQueue()
+    trace_file_listener = QueueListener(trace_file_queue, logging.FileHandler(TRACE_FILE, encoding="utf-8"))
+    trace_file_listener.start()
+    trace_file_logger = logging.getLogger("trazas")
+    trace_file_logger.setLevel(logging.INFO)
+    trace_file_logger.propagate = False
+    trace_file_logger.addHandler(QueueHandler(trace_file_queue))
+
+
+def parse_traceparent(value):
+    """(trace_id, parent_span_id) de una cabecera W3C traceparent; genera un trace nuevo si no es válida."""
+    parts = (value or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return os.urandom(16).hex(), None
+
+
+def record_span(span: dict):
+    trace_spans.append(span)
+    if trace_file_logger:
+        trace_file_logger.info(json.dumps(span, default=str))
+
+
+def stop_trace_file():
+    """Vacía la cola pendiente del archivo de trazas (en el shutdown del servicio)."""
+    if trace_file_listener:
+        trace_file_listener.stop()
+
+
+def record_query_span(query):
+    """Query logger de asyncpg: un span hijo del handler por cada sentencia SQL."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    record_span({
+        "trace_id": parent["trace_id"],
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent["span_id"],
+        "request_id": parent["request_id"],
+        "service": parent["service"],
+        "name": "sql",
+        "statement": " ".join(query.query.split())[:500],
+        "start": time.time() - query.elapsed,
+        "duration_ms": round(query.elapsed * 1000, 3),
+        "error": repr(query.exception) if query.exception else None,
+    })
+
+
+class TracingMiddleware:
+    """Span por petición con el trace y el X-Request-ID recibidos del gateway."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        trace_id, parent_id = parse_traceparent(headers.get("traceparent"))
+        request_id = headers.get("x-request-id") or trace_id
+        span = {
+            "trace_id": trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_id": parent_id,
+            "request_id": request_id,
+            "service": self.service,
+            "name": f"{scope['method']} {scope['path']}",
+            "start": time.time(),
+            "status": None,
+        }
+        token = current_span.set(span)
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                span["status"] = message["status"]
+                MutableHeaders(scope=message)["x-request-id"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                span["name"] = f"{scope['method']} {route.path}"
+            span["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            current_span.reset(token)
+            record_span(span)
+
+
+router = APIRouter()
+
+
+@router.get("/traces")
+async def get_traces(trace_id: Optional[str] = None, request_id: Optional[str] = None, limit: int = 200):
+    """Spans recientes de este servicio, filtrables por trace o request-id."""
+    spans = [
+        s for s in list(trace_spans)
+        if (trace_id is None or s["trace_id"] == trace_id)
+        and (request_id is None or s["request_id"] == request_id)
+    ]
+    return spans[-limit:]
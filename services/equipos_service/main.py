@@ -1,17 +1,157 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from collections import deque
 from pydantic import BaseModel
 from typing import Optional, List
 import asyncpg
+import asyncio
+import base64
+import csv
+import io
 import os
-from datetime import datetime, date
+import re
+import sys
+from datetime import datetime, date, timezone
+from decimal import Decimal
 import json
+import logging
+import openpyxl
+
+# services/common: en la imagen está junto a main.py; en local, un nivel arriba
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.db import PoolTimeout, acquire_conn, acquire_connection, create_pool, pool_status, pool_timeout_handler
+from common.etag import ETagMiddleware
+from common.responses import FastJSONResponse
+from common.tracing import TracingMiddleware, record_query_span, router as traces_router, stop_trace_file
+
+app = FastAPI(title="Equipos Service", version="1.0.0", default_response_class=FastJSONResponse)
+
+# -----------------------------
+# ETAG / GET CONDICIONAL
+# -----------------------------
+app.add_middleware(ETagMiddleware)
+
+# Compresión gzip de respuestas grandes (listados y reportes) hacia el gateway
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# -----------------------------
+# TRAZAS (request-id, spans de handler y de SQL)
+# -----------------------------
+SERVICE_NAME = "equipos"
+
+
+async def init_connection(conn):
+    conn.add_query_logger(record_query_span)
+    # especificaciones es JSONB: el driver la entrega ya como dict
+    await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+app.add_middleware(TracingMiddleware, service=SERVICE_NAME)
+app.include_router(traces_router)
 
-app = FastAPI(title="Equipos Service", version="1.0.0")
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# -----------------------------
+# POOL GLOBAL
+# -----------------------------
+pool = None
+
+@app.on_event("startup")
+async def startup_event():
+    global pool, reference_task, event_task
+    pool = await create_pool(DATABASE_URL, init=init_connection)
+    reference_task = asyncio.create_task(reference_listener())
+    event_task = asyncio.create_task(event_listener())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if reference_task:
+        reference_task.cancel()
+    if event_task:
+        event_task.cancel()
+    if pool:
+        await pool.close()
+    stop_trace_file()
+
 async def get_db_pool():
-    return await asyncpg.create_pool(DATABASE_URL)
+    return pool
+
+app.add_exception_handler(PoolTimeout, pool_timeout_handler)
+
+@app.get("/health/db")
+async def pool_health():
+    return pool_status(pool)
+
+# -----------------------------
+# CACHE DE DATOS DE REFERENCIA (LISTEN/NOTIFY)
+# -----------------------------
+# Las tablas pequeñas se guardan en memoria; los triggers de la base envían
+# NOTIFY referencias '<tabla>' y el listener recarga solo esa tabla.
+REFERENCE_CHANNEL = "referencias"
+REFERENCE_RECONNECT_DELAY = float(os.getenv("REFERENCE_RECONNECT_DELAY", "5"))
+
+REFERENCE_QUERIES = {
+    "categorias_equipos": "SELECT * FROM categorias_equipos ORDER BY nombre",
+    "ubicaciones": """
+        SELECT *, edificio || ' - ' || aula_oficina as nombre_completo
+        FROM ubicaciones
+        ORDER BY edificio, aula_oficina
+    """,
+    "proveedores": "SELECT id, razon_social FROM proveedores",
+}
+
+# tabla -> {"rows": [...], "by_id": {id: fila}}; vacío mientras no haya listener
+reference_cache = {}
+reference_task = None
+
+logger = logging.getLogger("equipos-service")
+
+
+def reference_ready() -> bool:
+    return len(reference_cache) == len(REFERENCE_QUERIES)
+
+
+async def refresh_reference(conn, table: str):
+    rows = [dict(row) for row in await conn.fetch(REFERENCE_QUERIES[table])]
+    reference_cache[table] = {"rows": rows, "by_id": {row["id"]: row for row in rows}}
+
+
+async def reference_listener():
+    """Mantiene la cache al día; si se pierde la conexión se vacía y se vuelve a SQL."""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(DATABASE_URL)
+            changes = asyncio.Queue()
+            await conn.add_listener(REFERENCE_CHANNEL, lambda c, pid, channel, table: changes.put_nowait(table))
+            conn.add_termination_listener(lambda c: changes.put_nowait(None))
+
+            # Carga inicial después de LISTEN para no perder cambios intermedios
+            for table in REFERENCE_QUERIES:
+                await refresh_reference(conn, table)
+
+            while True:
+                # Una ráfaga de avisos de la misma tabla se resuelve con una sola recarga
+                pending = {await changes.get()}
+                while not changes.empty():
+                    pending.add(changes.get_nowait())
+                if None in pending:
+                    break
+                for table in pending & REFERENCE_QUERIES.keys():
+                    await refresh_reference(conn, table)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Listener de datos de referencia: %s", exc)
+        finally:
+            reference_cache.clear()
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(REFERENCE_RECONNECT_DELAY)
+# -----------------------------
 
 class EquipoCreate(BaseModel):
     codigo_inventario: str
@@ -50,109 +190,752 @@ class MovimientoCreate(BaseModel):
     motivo: str
     observaciones: Optional[str] = None
 
+class MovimientoMasivo(BaseModel):
+    # Uno de los dos: lista de equipos o todos los de una ubicación
+    equipo_ids: Optional[List[int]] = None
+    ubicacion_origen_id: Optional[int] = None
+    ubicacion_destino_id: int
+    usuario_responsable_id: int
+    motivo: str
+    observaciones: Optional[str] = None
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "equipos"}
 
-@app.get("/equipos")
-async def get_equipos(
-    categoria: Optional[str] = None,
-    estado: Optional[str] = None,
-    ubicacion: Optional[int] = None
-):
-    pool = await get_db_pool()
-    
-    query = """
-        SELECT e.*, c.nombre as categoria_nombre, 
-               u.edificio || ' - ' || u.aula_oficina as ubicacion_nombre,
-               p.razon_social as proveedor_nombre
-        FROM equipos e
-        LEFT JOIN categorias_equipos c ON e.categoria_id = c.id
-        LEFT JOIN ubicaciones u ON e.ubicacion_actual_id = u.id
-        LEFT JOIN proveedores p ON e.proveedor_id = p.id
-        WHERE 1=1
+# -----------------------------
+# PAGINACIÓN POR CURSOR (KEYSET)
+# -----------------------------
+EQUIPOS_PAGE_MAX = int(os.getenv("EQUIPOS_PAGE_MAX", "500"))
+
+
+def encode_cursor(fecha_registro: datetime, equipo_id: int) -> str:
+    """Cursor opaco con la posición (fecha_registro, id) de la última fila entregada."""
+    raw = json.dumps([fecha_registro.isoformat(), equipo_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        fecha, equipo_id = json.loads(raw)
+        return datetime.fromisoformat(fecha), int(equipo_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# -----------------------------
+# FILTROS POR ESPECIFICACIONES (JSONB)
+# -----------------------------
+SPEC_FILTER = re.compile(r"^([A-Za-z0-9_]+)(>=|<=|!=|=|>|<)(.+)$")
+
+
+def spec_conditions(specs: List[str], param_count: int):
+    """Condiciones SQL para filtros `clave<op>valor`, p. ej. `ram_gb>=16` o `cpu=i7`.
+
+    La igualdad usa @>, que se resuelve con el índice GIN de especificaciones. En
+    las comparaciones solo el prefiltro de clave (?) usa el índice; la comparación
+    jsonpath es una llamada a función que se evalúa sobre esas filas.
+    Devuelve (condiciones, parámetros, siguiente número de parámetro).
     """
+    conditions = []
+    params = []
+    for spec in specs:
+        match = SPEC_FILTER.match(spec)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Filtro de especificación inválido: {spec}")
+        key, op, raw = match.groups()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+
+        if op == "=":
+            conditions.append(f"e.especificaciones @> ${param_count}::jsonb")
+            params.append({key: value})
+            param_count += 1
+        else:
+            conditions.append(
+                f"e.especificaciones ? ${param_count} AND "
+                f"jsonb_path_exists(e.especificaciones, ${param_count + 1}::jsonpath, ${param_count + 2}::jsonb)"
+            )
+            params.extend([key, f'$."{key}" ? (@ {op} $valor)', {"valor": value}])
+            param_count += 3
+    return conditions, params, param_count
+
+
+# -----------------------------
+# PROYECCIÓN DE CAMPOS (fields=)
+# -----------------------------
+# Campo permitido -> (expresión SQL, alias de la tabla unida que necesita)
+EQUIPO_FIELDS = {
+    "id": ("e.id", None),
+    "codigo_inventario": ("e.codigo_inventario", None),
+    "nombre": ("e.nombre", None),
+    "marca": ("e.marca", None),
+    "modelo": ("e.modelo", None),
+    "numero_serie": ("e.numero_serie", None),
+    "especificaciones": ("e.especificaciones", None),
+    "categoria_id": ("e.categoria_id", None),
+    "ubicacion_actual_id": ("e.ubicacion_actual_id", None),
+    "proveedor_id": ("e.proveedor_id", None),
+    "asignado_a_id": ("e.asignado_a_id", None),
+    "fecha_compra": ("e.fecha_compra", None),
+    "costo_compra": ("e.costo_compra", None),
+    "fecha_garantia_fin": ("e.fecha_garantia_fin", None),
+    "estado_operativo": ("e.estado_operativo", None),
+    "estado_fisico": ("e.estado_fisico", None),
+    "imagen_url": ("e.imagen_url", None),
+    "notas": ("e.notas", None),
+    "fecha_registro": ("e.fecha_registro", None),
+    "fecha_ultima_actualizacion": ("e.fecha_ultima_actualizacion", None),
+    "version": ("e.version", None),
+    "categoria_nombre": ("c.nombre", "c"),
+    "ubicacion_nombre": ("u.edificio || ' - ' || u.aula_oficina", "u"),
+    "proveedor_nombre": ("p.razon_social", "p"),
+    "asignado_a_nombre": ("usr.nombre_completo", "usr"),
+}
+
+EQUIPO_JOINS = {
+    "c": "LEFT JOIN categorias_equipos c ON e.categoria_id = c.id",
+    "u": "LEFT JOIN ubicaciones u ON e.ubicacion_actual_id = u.id",
+    "p": "LEFT JOIN proveedores p ON e.proveedor_id = p.id",
+    "usr": "LEFT JOIN usuarios usr ON e.asignado_a_id = usr.id",
+}
+
+
+def parse_fields(fields: Optional[str], allowed) -> Optional[List[str]]:
+    """Lista de campos pedidos en `fields=a,b,c`; None si no se indicó."""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in allowed]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no permitidos: {', '.join(unknown) or '(vacío)'}"
+        )
+    return names
+
+
+def equipo_projection(names: List[str], aliases=()):
+    """(lista SELECT, JOINs) con solo las tablas que usan los campos o filtros pedidos."""
+    columns = ", ".join(f"{EQUIPO_FIELDS[name][0]} AS {name}" for name in names)
+    needed = {EQUIPO_FIELDS[name][1] for name in names} | set(aliases)
+    joins = " ".join(join for alias, join in EQUIPO_JOINS.items() if alias in needed)
+    return columns, joins
+
+
+# Columnas del listado cuando no se pide `fields`
+EQUIPOS_LIST_COLUMNS = """e.*, c.nombre as categoria_nombre, 
+               u.edificio || ' - ' || u.aula_oficina as ubicacion_nombre,
+               p.razon_social as proveedor_nombre"""
+EQUIPOS_LIST_JOINS = " ".join(EQUIPO_JOINS[alias] for alias in ("c", "u", "p"))
+
+# Nombres que se resuelven desde la cache de referencia: campo -> (columna id, tabla, columna nombre)
+REFERENCE_FIELDS = {
+    "categoria_nombre": ("categoria_id", "categorias_equipos", "nombre"),
+    "ubicacion_nombre": ("ubicacion_actual_id", "ubicaciones", "nombre_completo"),
+    "proveedor_nombre": ("proveedor_id", "proveedores", "razon_social"),
+}
+
+
+def resolve_reference_names(item: dict, names, snapshot: dict):
+    for name in names:
+        column, table, label = REFERENCE_FIELDS[name]
+        ref = snapshot[table]["by_id"].get(item[column])
+        item[name] = ref[label] if ref else None
+
+
+def equipos_filters(categoria, estado, ubicacion, spec):
+    """(WHERE, parámetros, siguiente $n, JOINs que necesitan los filtros) del listado."""
+    where = " WHERE 1=1"
     params = []
     param_count = 1
     
-    if categoria:
-        query += f" AND c.nombre = ${param_count}"
+    filter_joins = []
+    if categoria and reference_ready():
+        # Con la cache, el nombre de la categoría se traduce a ids sin unir la tabla
+        where += f" AND e.categoria_id = ANY(${param_count}::int[])"
+        params.append([
+            row["id"] for row in reference_cache["categorias_equipos"]["rows"]
+            if row["nombre"] == categoria
+        ])
+        param_count += 1
+    elif categoria:
+        where += f" AND c.nombre = ${param_count}"
         params.append(categoria)
         param_count += 1
+        filter_joins.append("c")
     
     if estado:
-        query += f" AND e.estado_operativo = ${param_count}"
+        where += f" AND e.estado_operativo = ${param_count}"
         params.append(estado)
         param_count += 1
     
     if ubicacion:
-        query += f" AND e.ubicacion_actual_id = ${param_count}"
+        where += f" AND e.ubicacion_actual_id = ${param_count}"
         params.append(ubicacion)
         param_count += 1
+
+    conditions, spec_params, param_count = spec_conditions(spec, param_count)
+    for condition in conditions:
+        where += f" AND {condition}"
+    params.extend(spec_params)
+
+    return where, params, param_count, filter_joins
+
+
+@app.get("/equipos")
+async def get_equipos(
+    categoria: Optional[str] = None,
+    estado: Optional[str] = None,
+    ubicacion: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    spec: List[str] = Query([]),
+    fields: Optional[str] = None
+):
+    """Lista de equipos, del más reciente al más antiguo.
+
+    Sin `limit` devuelve la lista completa (comportamiento original). Con `limit`
+    devuelve una página {items, next_cursor[, total]}; la siguiente página se pide
+    con `cursor=next_cursor` y se resuelve con el índice (fecha_registro, id), así
+    que el costo no crece con la profundidad de la página.
+
+    `spec` (repetible) filtra por especificaciones: `spec=ram_gb>=16&spec=cpu=i7`.
+    `fields=codigo_inventario,marca,...` devuelve solo esos campos (ver EQUIPO_FIELDS).
+    Con la cache de referencia cargada, los nombres de categoría, ubicación y
+    proveedor se completan en memoria en lugar de unir esas tablas.
+    """
+    pool = await get_db_pool()
+    paginated = limit is not None or cursor is not None
     
-    query += " ORDER BY e.fecha_registro DESC"
+    where, params, param_count, filter_joins = equipos_filters(categoria, estado, ubicacion, spec)
+
+    names = parse_fields(fields, EQUIPO_FIELDS)
+    # Copia local: el listener puede vaciar la cache mientras se espera la consulta.
+    # Los nombres de una tabla que no está en la copia salen del JOIN en SQL.
+    snapshot = dict(reference_cache)
+    resolved = [
+        name for name in (names or REFERENCE_FIELDS)
+        if name in REFERENCE_FIELDS and REFERENCE_FIELDS[name][1] in snapshot
+    ]
+    if names is None:
+        if resolved:
+            joined = [name for name in REFERENCE_FIELDS if name not in resolved]
+            columns = ", ".join(["e.*"] + [f"{EQUIPO_FIELDS[name][0]} AS {name}" for name in joined])
+            aliases = set(filter_joins) | {EQUIPO_FIELDS[name][1] for name in joined}
+            joins = " ".join(join for alias, join in EQUIPO_JOINS.items() if alias in aliases)
+        else:
+            columns, joins = EQUIPOS_LIST_COLUMNS, EQUIPOS_LIST_JOINS
+    else:
+        selected = [name for name in names if name not in resolved]
+        # Columnas que no se devuelven: ids para resolver nombres y (fecha_registro, id) del cursor
+        extra = [REFERENCE_FIELDS[name][0] for name in resolved]
+        if paginated:
+            extra += ["fecha_registro", "id"]
+        selected += [name for name in dict.fromkeys(extra) if name not in selected]
+        columns, joins = equipo_projection(selected, filter_joins)
+
+    def to_item(row):
+        if names is None and not resolved:
+            return row
+        item = dict(row)
+        resolve_reference_names(item, resolved, snapshot)
+        return item if names is None else {name: item[name] for name in names}
     
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(query, *params)
-        equipos = []
-        for row in rows:
-            equipo = dict(row)
-            if equipo.get('especificaciones'):
-                # Manejo seguro de JSON
-                especificaciones = equipo.get('especificaciones')
-
-                if especificaciones is None or especificaciones == "" or especificaciones.strip() == "":
-                    equipo['especificaciones'] = {}
-                else:
-                    try:
-                        equipo['especificaciones'] = json.loads(especificaciones)
-                    except:
-                        equipo['especificaciones'] = {}
-            equipos.append(equipo)
-        return equipos
+    query = f"SELECT {columns} FROM equipos e {joins}{where}"
+    page_params = list(params)
+
+    if not paginated:
+        query += " ORDER BY e.fecha_registro DESC, e.id DESC"
+        async with acquire_conn(pool) as conn:
+            rows = await conn.fetch(query, *page_params)
+            return FastJSONResponse([to_item(row) for row in rows])
+
+    limit = min(limit or EQUIPOS_PAGE_MAX, EQUIPOS_PAGE_MAX)
+    if cursor:
+        fecha_registro, last_id = decode_cursor(cursor)
+        query += f" AND (e.fecha_registro, e.id) < (${param_count}, ${param_count + 1})"
+        page_params.extend([fecha_registro, last_id])
+        param_count += 2
+
+    # Una fila extra indica si existe una página siguiente
+    query += f" ORDER BY e.fecha_registro DESC, e.id DESC LIMIT ${param_count}"
+    page_params.append(limit + 1)
+
+    async with acquire_conn(pool) as conn:
+        rows = await conn.fetch(query, *page_params)
+        page = {"items": [to_item(row) for row in rows[:limit]], "limit": limit}
+
+        last = rows[limit - 1] if len(rows) > limit else None
+        page["next_cursor"] = encode_cursor(last["fecha_registro"], last["id"]) if last else None
+
+        if include_total:
+            # El conteo solo une las tablas que usan los filtros
+            count_joins = " ".join(EQUIPO_JOINS[alias] for alias in filter_joins)
+            page["total"] = await conn.fetchval(f"SELECT COUNT(*) FROM equipos e {count_joins}{where}", *params)
+        return FastJSONResponse(page)
+
+# -----------------------------
+# EXPORTACIÓN EN STREAMING (NDJSON / CSV)
+# -----------------------------
+# Filas que el cursor del servidor trae por viaje; también es el tamaño de cada bloque enviado
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_value(value):
+    """Valor serializable igual que en las respuestas JSON del servicio."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return export_value(value)
+
+
+async def export_rows(conn, query: str, params: list, formato: str):
+    """Recorre un cursor del servidor y produce bloques de texto de EXPORT_FETCH_SIZE filas."""
+    # Los cursores de asyncpg solo existen dentro de una transacción
+    async with conn.transaction(readonly=True):
+        statement = await conn.prepare(query)
+        buffer = io.StringIO()
+        writer = None
+        if formato == "csv":
+            # La cabecera sale antes de leer la primera fila (y también si no hay filas)
+            writer = csv.writer(buffer)
+            writer.writerow([attribute.name for attribute in statement.get_attributes()])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        pending = 0
+
+        async for row in statement.cursor(*params, prefetch=EXPORT_FETCH_SIZE):
+            if writer:
+                writer.writerow([export_csv_value(v) for v in row.values()])
+            else:
+                buffer.write(json.dumps({k: export_value(v) for k, v in row.items()}, ensure_ascii=False))
+                buffer.write("\n")
+            pending += 1
+            if pending >= EXPORT_FETCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+class ExportResponse(StreamingResponse):
+    """Devuelve la conexión al pool al terminar, aunque el cliente corte la descarga."""
+
+    def __init__(self, conn, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.conn = conn
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await pool.release(self.conn)
+
+
+@app.get("/equipos/exportar")
+async def exportar_equipos(
+    formato: str = "ndjson",
+    categoria: Optional[str] = None,
+    estado: Optional[str] = None,
+    ubicacion: Optional[int] = None,
+    spec: List[str] = Query([]),
+    fields: Optional[str] = None
+):
+    """Inventario completo en NDJSON o CSV, con los mismos filtros que GET /equipos.
+
+    Las filas se leen con un cursor del servidor en bloques de EXPORT_FETCH_SIZE y
+    se envían a medida que llegan, así que la memoria no depende del total exportado.
+    """
+    if formato not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (ndjson o csv)")
+
+    where, params, _, filter_joins = equipos_filters(categoria, estado, ubicacion, spec)
+    names = parse_fields(fields, EQUIPO_FIELDS)
+    if names is None:
+        columns, joins = EQUIPOS_LIST_COLUMNS, EQUIPOS_LIST_JOINS
+    else:
+        columns, joins = equipo_projection(names, filter_joins)
+    query = f"SELECT {columns} FROM equipos e {joins}{where} ORDER BY e.fecha_registro DESC, e.id DESC"
+
+    # La conexión se toma antes de responder para que un pool saturado siga dando 503
+    pool = await get_db_pool()
+    conn = await acquire_connection(pool)
+    return ExportResponse(
+        conn,
+        export_rows(conn, query, params, formato),
+        media_type=EXPORT_FORMATS[formato],
+        headers={"Content-Disposition": f'attachment; filename="equipos.{formato}"'},
+    )
+
+
+# -----------------------------
+# FEED DE CAMBIOS (GET /equipos/changes)
+# -----------------------------
+# El trigger trg_equipos_version guarda en equipos.version el id de la
+# transacción que modificó el equipo por última vez; los borrados quedan en
+# equipos_eliminados con la misma numeración. El feed recorre (version, id) en
+# orden, pero solo por debajo del xmin del snapshot: toda transacción con id
+# menor ya terminó, así que ningún cambio puede aparecer después detrás del
+# token entregado (una transacción larga abierta solo retrasa el feed).
+# Cada rama lee solo el tramo que necesita de su índice (version, id).
+EQUIPOS_CAMBIOS_QUERY = """
+    SELECT version, id, eliminado FROM (
+        (SELECT version, id, FALSE AS eliminado
+         FROM equipos
+         WHERE (version, id) > ($1, $2) AND version < $3
+         ORDER BY version, id
+         LIMIT $4)
+        UNION ALL
+        (SELECT version, equipo_id, TRUE
+         FROM equipos_eliminados
+         WHERE (version, equipo_id) > ($1, $2) AND version < $3
+         ORDER BY version, equipo_id
+         LIMIT $4)
+    ) cambios
+    ORDER BY version, id
+    LIMIT $4
+"""
+
+
+def encode_change_token(version: int, equipo_id: int) -> str:
+    """Token opaco con la posición (version, id) del último cambio entregado."""
+    raw = json.dumps([version, equipo_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_change_token(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        version, equipo_id = json.loads(raw)
+        return int(version), int(equipo_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Token de cambios inválido")
+
+
+@app.get("/equipos/changes")
+async def get_equipos_changes(since: Optional[str] = None, limit: int = Query(EQUIPOS_PAGE_MAX, ge=1)):
+    """Equipos creados, modificados y eliminados desde el token `since`.
+
+    Devuelve {upserts, deletes, next_token, has_more}: `upserts` con la misma forma
+    que los items de GET /equipos y `deletes` con los ids eliminados. Sin `since`
+    recorre todo el inventario (sincronización inicial); después se envía el
+    next_token de la respuesta anterior y el costo depende solo de los cambios.
+    Con has_more=true quedan cambios pendientes y conviene pedir de nuevo enseguida.
+    """
+    pool = await get_db_pool()
+    limit = min(limit, EQUIPOS_PAGE_MAX)
+    version, last_id = decode_change_token(since) if since else (0, 0)
+
+    async with acquire_conn(pool) as conn:
+        # Un solo snapshot para el horizonte, los cambios y las filas de los equipos
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            horizonte = await conn.fetchval("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+            cambios = await conn.fetch(EQUIPOS_CAMBIOS_QUERY, version, last_id, horizonte, limit + 1)
+            page = cambios[:limit]
+            ids = [c["id"] for c in page if not c["eliminado"]]
+            rows = []
+            if ids:
+                rows = await conn.fetch(f"""
+                    SELECT {EQUIPOS_LIST_COLUMNS}
+                    FROM equipos e
+                    {EQUIPOS_LIST_JOINS}
+                    WHERE e.id = ANY($1::int[])
+                    ORDER BY e.version, e.id
+                """, ids)
+
+    if page:
+        version, last_id = page[-1]["version"], page[-1]["id"]
+    return FastJSONResponse({
+        "upserts": rows,
+        "deletes": [c["id"] for c in page if c["eliminado"]],
+        "next_token": encode_change_token(version, last_id),
+        "has_more": len(cambios) > limit,
+    })
+
+
+# -----------------------------
+# EVENTOS EN VIVO (SSE, LISTEN/NOTIFY)
+# -----------------------------
+# Una sola conexión LISTEN equipos_eventos por proceso reparte cada aviso de los
+# triggers a la cola de cada cliente conectado. Los últimos EVENTS_BUFFER_SIZE
+# eventos se conservan para quien reconecta con Last-Event-ID; si ese id es de
+# otro arranque o de otra instancia, o ya salió del buffer, el cliente recibe
+# `resync` y debe recargar (o ponerse al día con GET /equipos/changes).
+EVENTS_CHANNEL = "equipos_eventos"
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+# Eventos pendientes por cliente; si se llena, se corta su stream y al reconectar se pone al día
+EVENTS_CLIENT_QUEUE = int(os.getenv("EVENTS_CLIENT_QUEUE", "1000"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+
+# Los ids son "<época>-<secuencia>"; la época cambia al arrancar y al reconectar el listener
+event_epoch = os.urandom(4).hex()
+event_seq = 0
+event_buffer = deque(maxlen=EVENTS_BUFFER_SIZE)  # (secuencia, evento SSE ya formateado)
+event_clients = set()  # una asyncio.Queue por cliente conectado
+event_task = None
+
+
+def sse_frame(event: str, data: str, event_id: str) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+def resync_frame() -> str:
+    return sse_frame("resync", "{}", f"{event_epoch}-{event_seq}")
+
+
+def push_event(queue: asyncio.Queue, frame: str):
+    try:
+        queue.put_nowait(frame)
+    except asyncio.QueueFull:
+        # Cliente lento: se descarta lo pendiente y se cierra su stream (None)
+        event_clients.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+def publish_event(payload: str):
+    """Callback de LISTEN: numera el aviso, lo guarda en el buffer y lo reparte."""
+    global event_seq
+    event_seq += 1
+    try:
+        tipo = json.loads(payload)["tipo"]
+    except (ValueError, KeyError, TypeError):
+        tipo = "message"
+    frame = sse_frame(tipo, payload, f"{event_epoch}-{event_seq}")
+    event_buffer.append((event_seq, frame))
+    for queue in list(event_clients):
+        push_event(queue, frame)
+
+
+def reset_events():
+    """Nueva época tras perder avisos: los clientes conectados deben resincronizar."""
+    global event_epoch, event_seq
+    event_epoch, event_seq = os.urandom(4).hex(), 0
+    event_buffer.clear()
+    for queue in list(event_clients):
+        push_event(queue, resync_frame())
+
+
+def events_since(last_event_id: Optional[str]):
+    """Eventos posteriores a Last-Event-ID; None si no se puede continuar desde ese id."""
+    if not last_event_id:
+        return []
+    epoch, _, seq = last_event_id.rpartition("-")
+    if epoch != event_epoch or not seq.isdigit() or int(seq) > event_seq:
+        return None
+    seq = int(seq)
+    if seq < event_seq and (not event_buffer or event_buffer[0][0] > seq + 1):
+        return None
+    return [frame for event_id, frame in event_buffer if event_id > seq]
+
+
+async def event_listener():
+    """Conexión LISTEN compartida por todos los clientes SSE; se reconecta si se pierde."""
+    connected_before = False
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(DATABASE_URL)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda c: closed.set())
+            await conn.add_listener(EVENTS_CHANNEL, lambda c, pid, channel, payload: publish_event(payload))
+            if connected_before:
+                # Los avisos emitidos mientras no había conexión se perdieron
+                reset_events()
+            connected_before = True
+            await closed.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Listener de eventos: %s", exc)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(REFERENCE_RECONNECT_DELAY)
+
+
+async def event_stream(last_event_id: Optional[str]):
+    queue = asyncio.Queue(maxsize=EVENTS_CLIENT_QUEUE)
+    # Sin await entre leer el buffer y registrar la cola: ningún evento se pierde ni se repite
+    replay = events_since(last_event_id)
+    resync = resync_frame()
+    position = f"{event_epoch}-{event_seq}"
+    event_clients.add(queue)
+    try:
+        if replay is None:
+            yield resync
+        elif replay:
+            yield "".join(replay)
+        # Un id sin data no dispara evento, pero fija Last-Event-ID aunque aún no llegue ninguno
+        yield f"retry: {EVENTS_RETRY_MS}\nid: {position}\n\n"
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Comentario SSE: mantiene abierta la conexión a través de proxies
+                yield ": keepalive\n\n"
+                continue
+            if frame is None:
+                return
+            yield frame
+    finally:
+        event_clients.discard(queue)
+
+
+@app.get("/equipos/eventos")
+async def get_equipos_eventos(request: Request):
+    """Server-Sent Events con los cambios del inventario.
+
+    Eventos: equipo_creado, equipo_actualizado, equipo_eliminado y movimiento (el
+    data es el JSON del trigger), y resync cuando el cliente debe recargar. Al
+    reconectar, EventSource envía Last-Event-ID y se reenvían los eventos perdidos.
+    """
+    return StreamingResponse(
+        event_stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# -----------------------------
+# BÚSQUEDA (texto completo + trigramas)
+# -----------------------------
+# Cada palabra de la consulta se busca por prefijo y, además, como las palabras
+# más parecidas del vocabulario (equipos_terminos, índice de trigramas), lo que
+# tolera errores de tipeo. LIKE sobre el texto completo cubre fragmentos de
+# códigos y números de serie. Ver equipos_busqueda en database/schema.sql.
+SEARCH_QUERY = """
+    WITH consulta AS (
+        SELECT to_tsquery('simple', string_agg(alternativas, ' & ')) AS q
+        FROM (
+            SELECT '(' || quote_literal(p.palabra) || ':*' || coalesce((
+                SELECT string_agg(' | ' || quote_literal(t.termino), '')
+                FROM (
+                    SELECT termino FROM equipos_terminos
+                    WHERE termino % p.palabra
+                    ORDER BY termino <-> p.palabra
+                    LIMIT 3
+                ) t
+            ), '') || ')' AS alternativas
+            FROM unnest(tsvector_to_array(to_tsvector('simple', $1))) AS p(palabra)
+        ) a
+    ),
+    resultados AS (
+        SELECT b.equipo_id,
+               ts_rank(b.documento, consulta.q)
+                 + (b.documento @@ plainto_tsquery('simple', $1))::int
+                 + (b.texto LIKE $2)::int AS relevancia
+        FROM equipos_busqueda b, consulta
+        WHERE b.documento @@ consulta.q OR b.texto LIKE $2
+        ORDER BY relevancia DESC, b.equipo_id DESC
+        LIMIT $3 OFFSET $4
+    )
+    SELECT e.*, c.nombre as categoria_nombre,
+           u.edificio || ' - ' || u.aula_oficina as ubicacion_nombre,
+           p.razon_social as proveedor_nombre,
+           r.relevancia
+    FROM resultados r
+    JOIN equipos e ON e.id = r.equipo_id
+    LEFT JOIN categorias_equipos c ON e.categoria_id = c.id
+    LEFT JOIN ubicaciones u ON e.ubicacion_actual_id = u.id
+    LEFT JOIN proveedores p ON e.proveedor_id = p.id
+    ORDER BY r.relevancia DESC, e.id DESC
+"""
+
+
+def like_pattern(texto: str) -> str:
+    escaped = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@app.get("/equipos/buscar")
+async def buscar_equipos(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000)
+):
+    """Búsqueda por nombre, marca, modelo, número de serie o código de inventario,
+    ordenada por relevancia."""
+    pool = await get_db_pool()
+    texto = q.strip().lower()
+
+    async with acquire_conn(pool) as conn:
+        # Una fila extra indica si existe una página siguiente
+        rows = await conn.fetch(SEARCH_QUERY, texto, like_pattern(texto), limit + 1, offset)
+
+    return FastJSONResponse({
+        "items": rows[:limit],
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if len(rows) > limit else None
+    })
 
 @app.get("/equipos/{equipo_id}")
-async def get_equipo(equipo_id: int):
+async def get_equipo(equipo_id: int, fields: Optional[str] = None):
+    """Detalle de un equipo con sus últimos EQUIPO_HISTORIAL_MAX movimientos.
+
+    El historial completo se pagina con GET /equipos/{id}/movimientos.
+    `fields=...` limita la respuesta a esos campos; el historial solo se consulta
+    si se pide `historial_movimientos`.
+    """
     pool = await get_db_pool()
-    
-    query = """
-        SELECT e.*, c.nombre as categoria_nombre,
+
+    names = parse_fields(fields, list(EQUIPO_FIELDS) + ["historial_movimientos"])
+    if names is None:
+        columns = """e.*, c.nombre as categoria_nombre,
                u.edificio || ' - ' || u.aula_oficina as ubicacion_nombre,
                p.razon_social as proveedor_nombre,
-               usr.nombre_completo as asignado_a_nombre
-        FROM equipos e
-        LEFT JOIN categorias_equipos c ON e.categoria_id = c.id
-        LEFT JOIN ubicaciones u ON e.ubicacion_actual_id = u.id
-        LEFT JOIN proveedores p ON e.proveedor_id = p.id
-        LEFT JOIN usuarios usr ON e.asignado_a_id = usr.id
-        WHERE e.id = $1
-    """
+               usr.nombre_completo as asignado_a_nombre"""
+        joins = " ".join(EQUIPO_JOINS.values())
+        with_historial = True
+    else:
+        with_historial = "historial_movimientos" in names
+        names = [name for name in names if name != "historial_movimientos"]
+        # Sin columnas pedidas basta con comprobar que el equipo existe
+        columns, joins = equipo_projection(names) if names else ("1 AS existe", "")
     
-    async with pool.acquire() as conn:
+    query = f"SELECT {columns} FROM equipos e {joins} WHERE e.id = $1"
+    
+    async with acquire_conn(pool) as conn:
         row = await conn.fetchrow(query, equipo_id)
         if not row:
             raise HTTPException(status_code=404, detail="Equipo no encontrado")
         
-        equipo = dict(row)
-        if equipo.get('especificaciones'):
-            equipo['especificaciones'] = json.loads(equipo['especificaciones'])
+        equipo = dict(row) if names is None or names else {}
+        if not with_historial:
+            return equipo
         
-        movimientos_query = """
-            SELECT m.*, 
-                   uo.edificio || ' - ' || uo.aula_oficina as origen,
-                   ud.edificio || ' - ' || ud.aula_oficina as destino,
-                   u.nombre_completo as responsable
-            FROM movimientos_equipos m
-            LEFT JOIN ubicaciones uo ON m.ubicacion_origen_id = uo.id
-            LEFT JOIN ubicaciones ud ON m.ubicacion_destino_id = ud.id
-            LEFT JOIN usuarios u ON m.usuario_responsable_id = u.id
-            WHERE m.equipo_id = $1
-            ORDER BY m.fecha_movimiento DESC
-        """
-        movimientos = await conn.fetch(movimientos_query, equipo_id)
-        equipo['historial_movimientos'] = [dict(m) for m in movimientos]
+        movimientos = await conn.fetch(
+            MOVIMIENTOS_QUERY.format(where="m.equipo_id = $1") + " LIMIT $2",
+            equipo_id, EQUIPO_HISTORIAL_MAX
+        )
+        equipo['historial_movimientos'] = movimientos
         
-        return equipo
+        return FastJSONResponse(equipo)
 
 @app.post("/equipos")
 async def create_equipo(equipo: EquipoCreate):
@@ -168,9 +951,7 @@ async def create_equipo(equipo: EquipoCreate):
         RETURNING id
     """
     
-    especificaciones_json = json.dumps(equipo.especificaciones) if equipo.especificaciones else None
-    
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         equipo_id = await conn.fetchval(
             query,
             equipo.codigo_inventario,
@@ -179,7 +960,7 @@ async def create_equipo(equipo: EquipoCreate):
             equipo.marca,
             equipo.modelo,
             equipo.numero_serie,
-            especificaciones_json,
+            equipo.especificaciones,
             equipo.proveedor_id,
             equipo.fecha_compra,
             equipo.costo_compra,
@@ -194,6 +975,265 @@ async def create_equipo(equipo: EquipoCreate):
         
         return {"id": equipo_id, "message": "Equipo creado exitosamente"}
 
+# -----------------------------
+# IMPORTACIÓN MASIVA (CSV / XLSX)
+# -----------------------------
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "50000"))
+
+# Columna del archivo -> tipo en la tabla de staging. Son las de EquipoCreate más
+# categoria, ubicacion y proveedor, que permiten usar el nombre en lugar del id.
+IMPORT_COLUMNS = {
+    "codigo_inventario": "TEXT",
+    "nombre": "TEXT",
+    "marca": "TEXT",
+    "modelo": "TEXT",
+    "numero_serie": "TEXT",
+    "especificaciones": "TEXT",
+    "categoria_id": "INT",
+    "categoria": "TEXT",
+    "ubicacion_actual_id": "INT",
+    "ubicacion": "TEXT",
+    "proveedor_id": "INT",
+    "proveedor": "TEXT",
+    "fecha_compra": "DATE",
+    "costo_compra": "NUMERIC(12,2)",
+    "fecha_garantia_fin": "DATE",
+    "estado_operativo": "TEXT",
+    "estado_fisico": "TEXT",
+    "asignado_a_id": "INT",
+    "notas": "TEXT",
+    "imagen_url": "TEXT",
+}
+
+IMPORT_STAGING = (
+    "CREATE TEMP TABLE equipos_importacion (fila INT PRIMARY KEY, "
+    + ", ".join(f"{column} {kind}" for column, kind in IMPORT_COLUMNS.items())
+    + ") ON COMMIT DROP"
+)
+
+# Nombres -> ids en bloque; si el archivo trae el id, tiene prioridad
+IMPORT_RESOLVE = [
+    """
+    UPDATE equipos_importacion s SET categoria_id = c.id
+    FROM categorias_equipos c
+    WHERE s.categoria_id IS NULL AND lower(c.nombre) = lower(s.categoria)
+    """,
+    """
+    UPDATE equipos_importacion s SET ubicacion_actual_id = u.id
+    FROM ubicaciones u
+    WHERE s.ubicacion_actual_id IS NULL
+      AND lower(u.edificio || ' - ' || u.aula_oficina) = lower(s.ubicacion)
+    """,
+    """
+    UPDATE equipos_importacion s SET proveedor_id = p.id
+    FROM proveedores p
+    WHERE s.proveedor_id IS NULL
+      AND (lower(p.razon_social) = lower(s.proveedor) OR p.ruc = s.proveedor)
+    """,
+]
+
+IMPORT_VALIDATION = """
+    SELECT fila, codigo_inventario, error FROM (
+        SELECT fila, codigo_inventario, 'nombre requerido' AS error
+        FROM equipos_importacion
+        WHERE nombre IS NULL OR btrim(nombre) = ''
+        UNION ALL
+        SELECT fila, codigo_inventario, 'codigo_inventario repetido en el archivo'
+        FROM (
+            SELECT fila, codigo_inventario,
+                   count(*) OVER (PARTITION BY codigo_inventario) AS repeticiones
+            FROM equipos_importacion
+        ) d
+        WHERE repeticiones > 1
+        UNION ALL
+        SELECT s.fila, s.codigo_inventario, 'codigo_inventario ya existe'
+        FROM equipos_importacion s
+        JOIN equipos e ON e.codigo_inventario = s.codigo_inventario
+        UNION ALL
+        SELECT fila, codigo_inventario,
+               'categoría no encontrada: ' || coalesce(categoria, categoria_id::text, '(vacía)')
+        FROM equipos_importacion s
+        WHERE NOT EXISTS (SELECT 1 FROM categorias_equipos c WHERE c.id = s.categoria_id)
+        UNION ALL
+        SELECT fila, codigo_inventario,
+               'ubicación no encontrada: ' || coalesce(ubicacion, ubicacion_actual_id::text)
+        FROM equipos_importacion s
+        WHERE (ubicacion IS NOT NULL OR ubicacion_actual_id IS NOT NULL)
+          AND NOT EXISTS (SELECT 1 FROM ubicaciones u WHERE u.id = s.ubicacion_actual_id)
+        UNION ALL
+        SELECT fila, codigo_inventario,
+               'proveedor no encontrado: ' || coalesce(proveedor, proveedor_id::text)
+        FROM equipos_importacion s
+        WHERE (proveedor IS NOT NULL OR proveedor_id IS NOT NULL)
+          AND NOT EXISTS (SELECT 1 FROM proveedores p WHERE p.id = s.proveedor_id)
+        UNION ALL
+        SELECT fila, codigo_inventario, 'usuario asignado no encontrado: ' || asignado_a_id
+        FROM equipos_importacion s
+        WHERE asignado_a_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM usuarios usr WHERE usr.id = s.asignado_a_id)
+    ) errores
+    ORDER BY fila
+"""
+
+IMPORT_MERGE = """
+    INSERT INTO equipos (
+        codigo_inventario, categoria_id, nombre, marca, modelo, numero_serie,
+        especificaciones, proveedor_id, fecha_compra, costo_compra,
+        fecha_garantia_fin, ubicacion_actual_id, estado_operativo, estado_fisico,
+        asignado_a_id, notas, imagen_url
+    )
+    SELECT codigo_inventario, categoria_id, nombre, marca, modelo, numero_serie,
+           especificaciones_a_jsonb(especificaciones), proveedor_id, fecha_compra, costo_compra,
+           fecha_garantia_fin, ubicacion_actual_id,
+           coalesce(estado_operativo, 'operativo'), coalesce(estado_fisico, 'bueno'),
+           asignado_a_id, notas, imagen_url
+    FROM equipos_importacion
+    WHERE fila <> ALL($1::int[])
+    ORDER BY fila
+    ON CONFLICT (codigo_inventario) DO NOTHING
+    RETURNING codigo_inventario
+"""
+
+IMPORT_CONFLICTS = """
+    SELECT fila, codigo_inventario, 'codigo_inventario ya existe' AS error
+    FROM equipos_importacion
+    WHERE fila <> ALL($1::int[]) AND codigo_inventario <> ALL($2::text[])
+"""
+
+
+def read_import_rows(filename: str, content: bytes):
+    """Iterador de filas (la primera es el encabezado) de un archivo CSV o XLSX."""
+    if filename.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        return workbook.active.iter_rows(values_only=True)
+
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("latin-1")
+    try:
+        # Excel en español exporta CSV separado por ';'
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(io.StringIO(text), dialect)
+
+
+def import_value(column: str, value):
+    """Convierte una celda al tipo de su columna de staging; None si está vacía."""
+    if value is None or (isinstance(value, str) and value.strip() == ""):
+        return None
+    kind = IMPORT_COLUMNS[column]
+    if kind == "INT":
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(value)
+        return int(number)
+    if kind == "DATE":
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return date.fromisoformat(str(value).strip())
+    if kind.startswith("NUMERIC"):
+        return Decimal(str(value).strip())
+    return str(value).strip()
+
+
+def staging_records(columns: List[str], rows, errors: list):
+    """Filas convertidas para COPY; las que no se pueden convertir van a `errors`."""
+    for numero, row in enumerate(rows, start=2):
+        if numero - 1 > IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Máximo {IMPORT_MAX_ROWS} filas por archivo")
+        values = dict(zip(columns, row))
+        if all(v is None or str(v).strip() == "" for v in values.values()):
+            continue
+
+        codigo = import_value("codigo_inventario", values.get("codigo_inventario"))
+        if codigo is None:
+            errors.append({"fila": numero, "codigo_inventario": None, "error": "codigo_inventario es obligatorio"})
+            continue
+
+        record = [numero]
+        for column in IMPORT_COLUMNS:
+            try:
+                record.append(import_value(column, values.get(column)))
+            except (ValueError, TypeError, ArithmeticError):
+                errors.append({
+                    "fila": numero,
+                    "codigo_inventario": codigo,
+                    "error": f"valor inválido en '{column}': {values.get(column)}"
+                })
+                break
+        else:
+            yield tuple(record)
+
+
+@app.post("/equipos/importar")
+async def importar_equipos(archivo: UploadFile = File(...), parcial: bool = False):
+    """Alta masiva desde CSV o XLSX con las columnas de EquipoCreate.
+
+    Las filas se cargan con COPY en una tabla temporal, se resuelven categoría,
+    ubicación y proveedor por nombre y se validan en bloque. Por defecto, si hay
+    algún error no se inserta nada; con `parcial=true` se insertan las filas válidas.
+    Devuelve el reporte de errores por número de fila del archivo.
+    """
+    content = await archivo.read()
+    try:
+        rows = iter(read_import_rows(archivo.filename or "", content))
+        header = next(rows, None)
+    except Exception:
+        raise HTTPException(status_code=400, detail="No se pudo leer el archivo (se acepta CSV o XLSX)")
+    if not header:
+        raise HTTPException(status_code=400, detail="El archivo está vacío")
+
+    columns = [str(h or "").strip().lower() for h in header]
+    unknown = [c for c in columns if c and c not in IMPORT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Columnas desconocidas: {', '.join(unknown)}")
+    if "codigo_inventario" not in columns:
+        raise HTTPException(status_code=400, detail="Falta la columna codigo_inventario")
+
+    errors = []
+    pool = await get_db_pool()
+    async with acquire_conn(pool) as conn:
+        async with conn.transaction():
+            await conn.execute(IMPORT_STAGING)
+            await conn.copy_records_to_table(
+                "equipos_importacion",
+                records=staging_records(columns, rows, errors),
+                columns=["fila", *IMPORT_COLUMNS]
+            )
+            staged = await conn.fetchval("SELECT count(*) FROM equipos_importacion")
+            total = staged + len(errors)
+
+            for statement in IMPORT_RESOLVE:
+                await conn.execute(statement)
+            validation = [dict(row) for row in await conn.fetch(IMPORT_VALIDATION)]
+            errors.extend(validation)
+
+            inserted = []
+            if parcial or not errors:
+                invalid_rows = sorted({e["fila"] for e in validation})
+                inserted = await conn.fetch(IMPORT_MERGE, invalid_rows)
+                if len(inserted) < staged - len(invalid_rows):
+                    # Otra petición registró alguno de los códigos después de la validación
+                    if not parcial:
+                        raise HTTPException(
+                            status_code=409,
+                            detail="Algunos códigos se registraron durante la importación; reintente"
+                        )
+                    codes = [row["codigo_inventario"] for row in inserted]
+                    errors.extend(dict(row) for row in await conn.fetch(IMPORT_CONFLICTS, invalid_rows, codes))
+
+    errors.sort(key=lambda e: e["fila"])
+    return {
+        "filas": total,
+        "insertados": len(inserted),
+        "errores": errors,
+        "message": f"{len(inserted)} equipos importados" if inserted else "No se importaron equipos"
+    }
+
 @app.put("/equipos/{equipo_id}")
 async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
     pool = await get_db_pool()
@@ -219,7 +1259,7 @@ async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
     
     if equipo.especificaciones is not None:
         updates.append(f"especificaciones = ${param_count}")
-        params.append(json.dumps(equipo.especificaciones))
+        params.append(equipo.especificaciones)
         param_count += 1
     
     if equipo.ubicacion_actual_id is not None:
@@ -253,7 +1293,7 @@ async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
     params.append(equipo_id)
     query = f"UPDATE equipos SET {', '.join(updates)} WHERE id = ${param_count}"
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         result = await conn.execute(query, *params)
         if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Equipo no encontrado")
@@ -264,56 +1304,316 @@ async def update_equipo(equipo_id: int, equipo: EquipoUpdate):
 async def delete_equipo(equipo_id: int):
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         result = await conn.execute("DELETE FROM equipos WHERE id = $1", equipo_id)
         if result == "DELETE 0":
             raise HTTPException(status_code=404, detail="Equipo no encontrado")
         
         return {"message": "Equipo eliminado exitosamente"}
 
+# Bloquea el equipo, registra el movimiento con su ubicación real de origen y
+# actualiza la ubicación en una sola sentencia (una transacción implícita).
+# Un movimiento concurrente del mismo equipo espera el bloqueo y lee el
+# origen ya actualizado; la fecha se toma después del bloqueo (clock_timestamp,
+# no NOW(), que es el inicio de la transacción) para que el orden por fecha
+# coincida con el orden real de los movimientos.
+MOVIMIENTO_QUERY = """
+    WITH actual AS (
+        SELECT id, ubicacion_actual_id
+        FROM equipos
+        WHERE id = $1
+        FOR UPDATE
+    ),
+    actualizado AS (
+        UPDATE equipos e
+        SET ubicacion_actual_id = $2
+        FROM actual a
+        WHERE e.id = a.id
+    )
+    INSERT INTO movimientos_equipos
+    (equipo_id, ubicacion_origen_id, ubicacion_destino_id, usuario_responsable_id, motivo, observaciones,
+     fecha_movimiento)
+    SELECT a.id, a.ubicacion_actual_id, $2, $3, $4, $5, clock_timestamp()::timestamp
+    FROM actual a
+    RETURNING id, ubicacion_origen_id
+"""
+
 @app.post("/movimientos")
 async def create_movimiento(movimiento: MovimientoCreate):
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        ubicacion_origen = await conn.fetchval(
-            "SELECT ubicacion_actual_id FROM equipos WHERE id = $1",
-            movimiento.equipo_id
-        )
+    async with acquire_conn(pool) as conn:
+        try:
+            row = await conn.fetchrow(
+                MOVIMIENTO_QUERY,
+                movimiento.equipo_id,
+                movimiento.ubicacion_destino_id,
+                movimiento.usuario_responsable_id,
+                movimiento.motivo,
+                movimiento.observaciones
+            )
+        except asyncpg.ForeignKeyViolationError:
+            raise HTTPException(status_code=404, detail="Ubicación de destino o usuario no encontrado")
         
-        await conn.execute(
-            """
-            INSERT INTO movimientos_equipos 
-            (equipo_id, ubicacion_origen_id, ubicacion_destino_id, usuario_responsable_id, motivo, observaciones)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            """,
-            movimiento.equipo_id,
-            ubicacion_origen,
-            movimiento.ubicacion_destino_id,
-            movimiento.usuario_responsable_id,
-            movimiento.motivo,
-            movimiento.observaciones
-        )
+        if row is None:
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
         
-        await conn.execute(
-            "UPDATE equipos SET ubicacion_actual_id = $1 WHERE id = $2",
-            movimiento.ubicacion_destino_id,
-            movimiento.equipo_id
+        return {
+            "id": row["id"],
+            "ubicacion_origen_id": row["ubicacion_origen_id"],
+            "message": "Movimiento registrado exitosamente"
+        }
+
+@app.post("/movimientos/masivo")
+async def create_movimientos_masivo(movimiento: MovimientoMasivo):
+    """Traslada varios equipos (p. ej. un aula completa) en una sola transacción.
+
+    Los equipos se bloquean, se registra un movimiento por cada uno con su
+    ubicación de origen y se actualiza su ubicación en una única sentencia.
+    Los que ya están en el destino se omiten.
+    """
+    if (movimiento.equipo_ids is None) == (movimiento.ubicacion_origen_id is None):
+        raise HTTPException(status_code=400, detail="Indique equipo_ids o ubicacion_origen_id (solo uno)")
+
+    if movimiento.equipo_ids is not None:
+        seleccion = "e.id = ANY($1::int[])"
+        origen = movimiento.equipo_ids
+    else:
+        seleccion = "e.ubicacion_actual_id = $1"
+        origen = movimiento.ubicacion_origen_id
+
+    query = f"""
+        WITH seleccionados AS (
+            SELECT e.id, e.ubicacion_actual_id
+            FROM equipos e
+            WHERE {seleccion}
+              AND e.ubicacion_actual_id IS DISTINCT FROM $2
+            -- Orden fijo de bloqueo: dos traslados masivos que se solapan no se bloquean mutuamente
+            ORDER BY e.id
+            FOR UPDATE
+        ),
+        actualizados AS (
+            UPDATE equipos e
+            SET ubicacion_actual_id = $2
+            FROM seleccionados s
+            WHERE e.id = s.id
         )
-        
-        return {"message": "Movimiento registrado exitosamente"}
+        INSERT INTO movimientos_equipos
+        (equipo_id, ubicacion_origen_id, ubicacion_destino_id, usuario_responsable_id, motivo, observaciones,
+         fecha_movimiento)
+        SELECT s.id, s.ubicacion_actual_id, $2, $3, $4, $5, clock_timestamp()::timestamp
+        FROM seleccionados s
+        RETURNING equipo_id
+    """
+
+    pool = await get_db_pool()
+    async with acquire_conn(pool) as conn:
+        async with conn.transaction():
+            destino = await conn.fetchval(
+                "SELECT id FROM ubicaciones WHERE id = $1", movimiento.ubicacion_destino_id
+            )
+            if destino is None:
+                raise HTTPException(status_code=404, detail="Ubicación de destino no encontrada")
+
+            try:
+                rows = await conn.fetch(
+                    query,
+                    origen,
+                    movimiento.ubicacion_destino_id,
+                    movimiento.usuario_responsable_id,
+                    movimiento.motivo,
+                    movimiento.observaciones
+                )
+            except asyncpg.ForeignKeyViolationError:
+                raise HTTPException(status_code=404, detail="Usuario responsable no encontrado")
+
+    return {
+        "movidos": len(rows),
+        "equipo_ids": [row["equipo_id"] for row in rows],
+        "message": f"{len(rows)} equipos trasladados"
+    }
+
+# -----------------------------
+# HISTORIAL Y UBICACIÓN EN UNA FECHA
+# -----------------------------
+# Movimientos incluidos en GET /equipos/{id}; el resto se pide paginado
+EQUIPO_HISTORIAL_MAX = int(os.getenv("EQUIPO_HISTORIAL_MAX", "50"))
+
+# Del más reciente al más antiguo; recorre idx_movimientos_equipo_fecha al revés
+MOVIMIENTOS_QUERY = """
+    SELECT m.*, 
+           uo.edificio || ' - ' || uo.aula_oficina as origen,
+           ud.edificio || ' - ' || ud.aula_oficina as destino,
+           u.nombre_completo as responsable
+    FROM movimientos_equipos m
+    LEFT JOIN ubicaciones uo ON m.ubicacion_origen_id = uo.id
+    LEFT JOIN ubicaciones ud ON m.ubicacion_destino_id = ud.id
+    LEFT JOIN usuarios u ON m.usuario_responsable_id = u.id
+    WHERE {where}
+    ORDER BY m.fecha_movimiento DESC, m.id DESC
+"""
+
+# Ubicación de `e` en la fecha $2: destino del último movimiento hasta esa fecha;
+# si no lo hay, origen del primer movimiento posterior; si tampoco, la actual.
+# Cada lateral es una sola lectura de idx_movimientos_equipo_fecha.
+UBICACION_EN_FECHA_JOINS = """
+    LEFT JOIN LATERAL (
+        SELECT m.id, m.ubicacion_destino_id, m.fecha_movimiento
+        FROM movimientos_equipos m
+        WHERE m.equipo_id = e.id AND m.fecha_movimiento <= $2
+        ORDER BY m.fecha_movimiento DESC, m.id DESC
+        LIMIT 1
+    ) antes ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT TRUE AS existe, m.ubicacion_origen_id
+        FROM movimientos_equipos m
+        WHERE m.equipo_id = e.id AND m.fecha_movimiento > $2
+        ORDER BY m.fecha_movimiento, m.id
+        LIMIT 1
+    ) despues ON antes.id IS NULL
+"""
+UBICACION_EN_FECHA = """
+    CASE WHEN antes.id IS NOT NULL THEN antes.ubicacion_destino_id
+         WHEN despues.existe THEN despues.ubicacion_origen_id
+         ELSE e.ubicacion_actual_id END
+"""
+# Un equipo cuenta desde su registro, o desde su primer movimiento si es anterior
+REGISTRADO_EN_FECHA = "(e.fecha_registro <= $2 OR antes.id IS NOT NULL)"
+
+
+def naive_timestamp(fecha: datetime) -> datetime:
+    """fecha_movimiento es TIMESTAMP sin zona (UTC en el contenedor de PostgreSQL)."""
+    if fecha.tzinfo is not None:
+        return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+@app.get("/equipos/{equipo_id}/movimientos")
+async def get_movimientos_equipo(
+    equipo_id: int,
+    limit: int = Query(50, ge=1),
+    cursor: Optional[str] = None
+):
+    """Historial de movimientos paginado por cursor, del más reciente al más antiguo."""
+    pool = await get_db_pool()
+    limit = min(limit, EQUIPOS_PAGE_MAX)
+
+    where = "m.equipo_id = $1"
+    params = [equipo_id]
+    if cursor:
+        fecha_movimiento, last_id = decode_cursor(cursor)
+        where += " AND (m.fecha_movimiento, m.id) < ($2, $3)"
+        params.extend([fecha_movimiento, last_id])
+    query = MOVIMIENTOS_QUERY.format(where=where) + f" LIMIT ${len(params) + 1}"
+    params.append(limit + 1)
+
+    async with acquire_conn(pool) as conn:
+        rows = await conn.fetch(query, *params)
+        if not rows and not await conn.fetchval("SELECT 1 FROM equipos WHERE id = $1", equipo_id):
+            raise HTTPException(status_code=404, detail="Equipo no encontrado")
+
+    last = rows[limit - 1] if len(rows) > limit else None
+    return FastJSONResponse({
+        "items": rows[:limit],
+        "limit": limit,
+        "next_cursor": encode_cursor(last["fecha_movimiento"], last["id"]) if last else None,
+    })
+
+
+@app.get("/equipos/{equipo_id}/ubicacion")
+async def get_ubicacion_equipo_en_fecha(equipo_id: int, fecha: datetime):
+    """Dónde estaba un equipo en `fecha` y desde cuándo (movimiento que lo llevó allí)."""
+    pool = await get_db_pool()
+    query = f"""
+        SELECT x.*, u.edificio || ' - ' || u.aula_oficina as ubicacion_nombre
+        FROM (
+            SELECT e.id AS equipo_id, {UBICACION_EN_FECHA} AS ubicacion_id,
+                   antes.id AS movimiento_id, antes.fecha_movimiento AS desde,
+                   {REGISTRADO_EN_FECHA} AS registrado
+            FROM equipos e
+            {UBICACION_EN_FECHA_JOINS}
+            WHERE e.id = $1
+        ) x
+        LEFT JOIN ubicaciones u ON u.id = x.ubicacion_id
+    """
+    fecha = naive_timestamp(fecha)
+    async with acquire_conn(pool) as conn:
+        row = await conn.fetchrow(query, equipo_id, fecha)
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    if not row["registrado"]:
+        raise HTTPException(status_code=404, detail="El equipo no estaba registrado en esa fecha")
+
+    resultado = dict(row)
+    del resultado["registrado"]
+    resultado["fecha"] = fecha
+    return resultado
+
+
+@app.get("/ubicaciones/{ubicacion_id}/equipos")
+async def get_equipos_ubicacion_en_fecha(ubicacion_id: int, fecha: datetime):
+    """Inventario de una ubicación en `fecha`.
+
+    Cada movimiento cubre el periodo [fecha_movimiento, fecha_hasta) en su destino,
+    así que la consulta es una búsqueda en idx_movimientos_destino_periodo; se
+    añaden los equipos que aún no se habían movido y los que nunca se movieron.
+    """
+    pool = await get_db_pool()
+    query = """
+        SELECT e.id, e.codigo_inventario, e.nombre, e.marca, e.modelo,
+               m.id AS movimiento_id, m.fecha_movimiento AS desde
+        FROM movimientos_equipos m
+        JOIN equipos e ON e.id = m.equipo_id
+        WHERE m.ubicacion_destino_id = $1
+          AND tsrange(m.fecha_movimiento, m.fecha_hasta) @> $2::timestamp
+        UNION ALL
+        -- Antes de su primer movimiento estaban en el origen de ese movimiento
+        SELECT e.id, e.codigo_inventario, e.nombre, e.marca, e.modelo, NULL, NULL
+        FROM movimientos_equipos m
+        JOIN equipos e ON e.id = m.equipo_id
+        WHERE m.primero AND m.ubicacion_origen_id = $1
+          AND m.fecha_movimiento > $2 AND e.fecha_registro <= $2
+        UNION ALL
+        SELECT e.id, e.codigo_inventario, e.nombre, e.marca, e.modelo, NULL, NULL
+        FROM equipos e
+        WHERE e.ubicacion_actual_id = $1 AND e.fecha_registro <= $2
+          AND NOT EXISTS (SELECT 1 FROM movimientos_equipos m WHERE m.equipo_id = e.id)
+        ORDER BY codigo_inventario, id
+    """
+    fecha = naive_timestamp(fecha)
+    async with acquire_conn(pool) as conn:
+        ubicacion = await conn.fetchrow(
+            "SELECT id, edificio || ' - ' || aula_oficina as nombre FROM ubicaciones WHERE id = $1",
+            ubicacion_id
+        )
+        if not ubicacion:
+            raise HTTPException(status_code=404, detail="Ubicación no encontrada")
+        rows = await conn.fetch(query, ubicacion_id, fecha)
+
+    return FastJSONResponse({
+        "ubicacion_id": ubicacion_id,
+        "ubicacion_nombre": ubicacion["nombre"],
+        "fecha": fecha,
+        "total": len(rows),
+        "items": rows,
+    })
 
 @app.get("/categorias")
 async def get_categorias():
+    if reference_ready():
+        return FastJSONResponse(reference_cache["categorias_equipos"]["rows"])
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch("SELECT * FROM categorias_equipos ORDER BY nombre")
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 @app.get("/ubicaciones")
 async def get_ubicaciones():
+    if reference_ready():
+        return FastJSONResponse([row for row in reference_cache["ubicaciones"]["rows"] if row["activo"]])
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(
             """
             SELECT *, edificio || ' - ' || aula_oficina as nombre_completo 
@@ -322,7 +1622,7 @@ async def get_ubicaciones():
             ORDER BY edificio, aula_oficina
             """
         )
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 if __name__ == "__main__":
     import uvicorn
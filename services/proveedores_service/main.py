@@ -1,16 +1,137 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import Optional
 import asyncpg
+import asyncio
 import os
+import sys
+import logging
 from datetime import date
 
-app = FastAPI(title="Proveedores Service", version="1.0.0")
+# services/common: en la imagen está junto a main.py; en local, un nivel arriba
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.db import PoolTimeout, acquire_conn, create_pool, pool_status, pool_timeout_handler
+from common.etag import ETagMiddleware
+from common.responses import FastJSONResponse
+from common.tracing import TracingMiddleware, record_query_span, router as traces_router, stop_trace_file
+
+app = FastAPI(title="Proveedores Service", version="1.0.0", default_response_class=FastJSONResponse)
+
+# -----------------------------
+# ETAG / GET CONDICIONAL
+# -----------------------------
+app.add_middleware(ETagMiddleware)
+
+# Compresión gzip de respuestas grandes (listados y reportes) hacia el gateway
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# -----------------------------
+# TRAZAS (request-id, spans de handler y de SQL)
+# -----------------------------
+SERVICE_NAME = "proveedores"
+
+
+async def init_connection(conn):
+    conn.add_query_logger(record_query_span)
+
+
+app.add_middleware(TracingMiddleware, service=SERVICE_NAME)
+app.include_router(traces_router)
+
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# -----------------------------
+# POOL GLOBAL
+# -----------------------------
+pool = None
+
+@app.on_event("startup")
+async def startup_event():
+    global pool, reference_task
+    pool = await create_pool(DATABASE_URL, init=init_connection)
+    reference_task = asyncio.create_task(reference_listener())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if reference_task:
+        reference_task.cancel()
+    if pool:
+        await pool.close()
+    stop_trace_file()
+
 async def get_db_pool():
-    return await asyncpg.create_pool(DATABASE_URL)
+    return pool
+
+app.add_exception_handler(PoolTimeout, pool_timeout_handler)
+
+@app.get("/health/db")
+async def pool_health():
+    return pool_status(pool)
+
+# -----------------------------
+# CACHE DE DATOS DE REFERENCIA (LISTEN/NOTIFY)
+# -----------------------------
+# La tabla de proveedores se guarda en memoria; el trigger de la base envía
+# NOTIFY referencias 'proveedores' y el listener la recarga.
+REFERENCE_CHANNEL = "referencias"
+REFERENCE_RECONNECT_DELAY = float(os.getenv("REFERENCE_RECONNECT_DELAY", "5"))
+
+REFERENCE_QUERIES = {
+    "proveedores": "SELECT * FROM proveedores ORDER BY razon_social",
+}
+
+# tabla -> {"rows": [...], "by_id": {id: fila}}; vacío mientras no haya listener
+reference_cache = {}
+reference_task = None
+
+logger = logging.getLogger("proveedores-service")
+
+
+def reference_ready() -> bool:
+    return len(reference_cache) == len(REFERENCE_QUERIES)
+
+
+async def refresh_reference(conn, table: str):
+    rows = [dict(row) for row in await conn.fetch(REFERENCE_QUERIES[table])]
+    reference_cache[table] = {"rows": rows, "by_id": {row["id"]: row for row in rows}}
+
+
+async def reference_listener():
+    """Mantiene la cache al día; si se pierde la conexión se vacía y se vuelve a SQL."""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(DATABASE_URL)
+            changes = asyncio.Queue()
+            await conn.add_listener(REFERENCE_CHANNEL, lambda c, pid, channel, table: changes.put_nowait(table))
+            conn.add_termination_listener(lambda c: changes.put_nowait(None))
+
+            # Carga inicial después de LISTEN para no perder cambios intermedios
+            for table in REFERENCE_QUERIES:
+                await refresh_reference(conn, table)
+
+            while True:
+                # Una ráfaga de avisos de la misma tabla se resuelve con una sola recarga
+                pending = {await changes.get()}
+                while not changes.empty():
+                    pending.add(changes.get_nowait())
+                if None in pending:
+                    break
+                for table in pending & REFERENCE_QUERIES.keys():
+                    await refresh_reference(conn, table)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Listener de datos de referencia: %s", exc)
+        finally:
+            reference_cache.clear()
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(REFERENCE_RECONNECT_DELAY)
+# -----------------------------
 
 class ProveedorCreate(BaseModel):
     razon_social: str
@@ -50,6 +171,12 @@ async def health_check():
 
 @app.get("/proveedores")
 async def get_proveedores(activo: Optional[bool] = None):
+    if reference_ready():
+        rows = reference_cache["proveedores"]["rows"]
+        if activo is None:
+            return FastJSONResponse(rows)
+        return FastJSONResponse([row for row in rows if row["activo"] == activo])
+
     pool = await get_db_pool()
     
     query = "SELECT * FROM proveedores"
@@ -61,15 +188,15 @@ async def get_proveedores(activo: Optional[bool] = None):
     
     query += " ORDER BY razon_social"
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query, *params)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 @app.get("/proveedores/{proveedor_id}")
 async def get_proveedor(proveedor_id: int):
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         proveedor = await conn.fetchrow(
             "SELECT * FROM proveedores WHERE id = $1",
             proveedor_id
@@ -99,9 +226,9 @@ async def get_proveedor(proveedor_id: int):
             """,
             proveedor_id
         )
-        resultado['contratos'] = [dict(c) for c in contratos]
+        resultado['contratos'] = contratos
         
-        return resultado
+        return FastJSONResponse(resultado)
 
 @app.post("/proveedores")
 async def create_proveedor(proveedor: ProveedorCreate):
@@ -115,7 +242,7 @@ async def create_proveedor(proveedor: ProveedorCreate):
         RETURNING id
     """
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         try:
             proveedor_id = await conn.fetchval(
                 query,
@@ -152,7 +279,7 @@ async def update_proveedor(proveedor_id: int, proveedor: ProveedorUpdate):
     params.append(proveedor_id)
     query = f"UPDATE proveedores SET {', '.join(updates)} WHERE id = ${param_count}"
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         result = await conn.execute(query, *params)
         if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Proveedor no encontrado")
@@ -176,9 +303,9 @@ async def get_contratos(proveedor_id: Optional[int] = None):
     
     query += " ORDER BY c.fecha_inicio DESC"
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query, *params)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 @app.post("/contratos")
 async def create_contrato(contrato: ContratoCreate):
@@ -194,7 +321,7 @@ async def create_contrato(contrato: ContratoCreate):
     
     estado = "vigente" if contrato.fecha_fin >= date.today() else "vencido"
     
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         try:
             contrato_id = await conn.fetchval(
                 query,
@@ -1,8 +1,10 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import Optional
 import asyncpg
 import os
+import sys
 from datetime import datetime, date
 import pandas as pd
 from reportlab.lib.pagesizes import A4
@@ -11,28 +13,64 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet
 import io
 
-app = FastAPI(title="Reportes Service", version="1.0.0")
+# services/common: en la imagen está junto a main.py; en local, un nivel arriba
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.db import PoolTimeout, acquire_conn, create_pool, pool_status, pool_timeout_handler
+from common.etag import ETagMiddleware
+from common.responses import FastJSONResponse
+from common.tracing import TracingMiddleware, record_query_span, router as traces_router, stop_trace_file
+
+app = FastAPI(title="Reportes Service", version="1.0.0", default_response_class=FastJSONResponse)
+
+# -----------------------------
+# ETAG / GET CONDICIONAL
+# -----------------------------
+app.add_middleware(ETagMiddleware)
+
+# Compresión gzip de respuestas grandes (listados y reportes) hacia el gateway
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# -----------------------------
+# TRAZAS (request-id, spans de handler y de SQL)
+# -----------------------------
+SERVICE_NAME = "reportes"
+
+
+async def init_connection(conn):
+    conn.add_query_logger(record_query_span)
+
+
+app.add_middleware(TracingMiddleware, service=SERVICE_NAME)
+app.include_router(traces_router)
+
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 # -----------------------------
-# POOL GLOBAL (CORRECCIÓN)
+# POOL GLOBAL
 # -----------------------------
 pool = None
 
 @app.on_event("startup")
 async def startup_event():
     global pool
-    pool = await asyncpg.create_pool(DATABASE_URL, max_size=10)
+    pool = await create_pool(DATABASE_URL, init=init_connection)
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global pool
     if pool:
         await pool.close()
+    stop_trace_file()
 
 async def get_db_pool():
     return pool
+
+app.add_exception_handler(PoolTimeout, pool_timeout_handler)
+
+@app.get("/health/db")
+async def pool_health():
+    return pool_status(pool)
 # -----------------------------
 
 
@@ -45,7 +83,7 @@ async def health_check():
 async def get_dashboard():
     pool = await get_db_pool()
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         total_equipos = await conn.fetchval("SELECT COUNT(*) FROM equipos")
 
         equipos_operativos = await conn.fetchval(
@@ -99,9 +137,9 @@ async def get_equipos_por_ubicacion():
         ORDER BY cantidad DESC
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/equipos-por-estado")
@@ -115,9 +153,9 @@ async def get_equipos_por_estado():
         ORDER BY cantidad DESC
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/equipos-por-categoria")
@@ -133,9 +171,9 @@ async def get_equipos_por_categoria():
         ORDER BY cantidad DESC
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/equipos-antiguedad")
@@ -165,9 +203,9 @@ async def get_equipos_antiguedad():
             END
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/costos-mantenimiento")
@@ -191,9 +229,9 @@ async def get_costos_mantenimiento(year: Optional[int] = None):
         ORDER BY mes_num, tipo
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query, year)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/mantenimientos-por-prioridad")
@@ -214,9 +252,9 @@ async def get_mantenimientos_por_prioridad():
             END
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 @app.get("/equipos-garantia")
@@ -235,9 +273,9 @@ async def get_equipos_garantia():
         GROUP BY estado_garantia
     """
 
-    async with pool.acquire() as conn:
+    async with acquire_conn(pool) as conn:
         rows = await conn.fetch(query)
-        return [dict(row) for row in rows]
+        return FastJSONResponse(rows)
 
 
 # -----------------------------
@@ -274,7 +312,7 @@ async def export_excel(report_data: dict):
         else:
             raise HTTPException(status_code=400, detail="Tipo de reporte no válido")
 
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             rows = await conn.fetch(query)
 
         df = pd.DataFrame([dict(r) for r in rows])
@@ -329,7 +367,7 @@ async def export_pdf(report_data: dict):
             """
             headers = ['Código', 'Nombre', 'Categoría', 'Estado', 'Ubicación']
 
-        async with pool.acquire() as conn:
+        async with acquire_conn(pool) as conn:
             rows = await conn.fetch(query)
 
         data = [headers]